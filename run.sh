@@ -10,12 +10,12 @@ start_server() {
     source "$VENV_DIR/bin/activate"
     if [ "$1" == "-d" ]; then
         # 后台启动
-        nohup uv run start.py > "$LOG_FILE" 2>&1 &
+        nohup uv run serve.py > "$LOG_FILE" 2>&1 &
         echo $! > "$PID_FILE"
         echo "服务已在后台启动，日志输出到 $LOG_FILE，PID: $(cat $PID_FILE)"
     else
         # 前台启动
-        uv run start.py
+        uv run serve.py
     fi
 }
 
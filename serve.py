@@ -0,0 +1,4 @@
+from src.server import serve
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,238 @@
+# Audio encoding/decoding helpers shared by the TTS and STT paths
+
+import io
+from typing import Optional
+
+import numpy as np
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/opus",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+}
+
+# soundfile (libsndfile) container/subtype per output format
+_SOUNDFILE_FORMATS = {
+    "wav": ("WAV", "PCM_16"),
+    "flac": ("FLAC", "PCM_16"),
+    "mp3": ("MP3", None),
+    "opus": ("OGG", "OPUS"),
+}
+
+# ffmpeg format names used by the pydub fallback
+_FFMPEG_FORMATS = {
+    "aac": "adts",
+    "opus": "opus",
+    "mp3": "mp3",
+}
+
+
+def content_type_for(output_format: str) -> str:
+    return CONTENT_TYPES.get(output_format, "audio/mpeg")
+
+
+def encode_audio(audio: np.ndarray, sample_rate: int, output_format: str) -> bytes:
+    """
+    Encodes float PCM (-1..1, mono or [samples, channels]) into `output_format`.
+    Uses libsndfile where it supports the format and sample rate, and falls
+    back to ffmpeg through pydub otherwise (e.g. AAC, or Opus at 44.1 kHz).
+    """
+    import soundfile as sf
+
+    audio = np.asarray(audio, dtype=np.float32)
+    if output_format in _SOUNDFILE_FORMATS:
+        container, subtype = _SOUNDFILE_FORMATS[output_format]
+        buffer = io.BytesIO()
+        try:
+            sf.write(buffer, audio, sample_rate, format=container, subtype=subtype)
+            return buffer.getvalue()
+        except (RuntimeError, TypeError, ValueError) as e:
+            if output_format not in _FFMPEG_FORMATS:
+                raise
+            print(f"soundfile cannot encode {output_format} at {sample_rate} Hz ({e}); using ffmpeg")
+
+    from pydub import AudioSegment
+
+    wav_buffer = io.BytesIO()
+    sf.write(wav_buffer, audio, sample_rate, format="WAV", subtype="PCM_16")
+    wav_buffer.seek(0)
+    segment = AudioSegment.from_file(wav_buffer, format="wav")
+    out = io.BytesIO()
+    segment.export(out, format=_FFMPEG_FORMATS.get(output_format, output_format))
+    return out.getvalue()
+
+
+def decode_audio(data: bytes) -> tuple[np.ndarray, int]:
+    """
+    Decodes an audio file held in memory into float32 PCM of shape
+    [samples, channels] and its sample rate. Uses libsndfile when it knows
+    the container and ffmpeg through pydub otherwise (e.g. m4a/aac).
+    """
+    import soundfile as sf
+
+    try:
+        audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        return audio, sample_rate
+    except (RuntimeError, TypeError, ValueError, sf.LibsndfileError):
+        pass
+
+    from pydub import AudioSegment
+
+    segment = AudioSegment.from_file(io.BytesIO(data))
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+    samples /= float(1 << (8 * segment.sample_width - 1))
+    return samples.reshape(-1, segment.channels), segment.frame_rate
+
+
+def resample(audio: np.ndarray, orig_rate: int, target_rate: int) -> np.ndarray:
+    """Band-limited resampling of mono PCM by zero-padding/truncating its spectrum."""
+    if orig_rate == target_rate or len(audio) == 0:
+        return audio.astype(np.float32, copy=False)
+    n_out = max(1, int(round(len(audio) * target_rate / orig_rate)))
+    spectrum = np.fft.rfft(audio)
+    n_bins = n_out // 2 + 1
+    if n_bins <= len(spectrum):
+        spectrum = spectrum[:n_bins]
+    else:
+        spectrum = np.pad(spectrum, (0, n_bins - len(spectrum)))
+    out = np.fft.irfft(spectrum, n_out) * (n_out / len(audio))
+    return out.astype(np.float32)
+
+
+# MPEG audio frame header tables, indexed by version (1, 2, 2.5) and layer
+_MP3_BITRATES_KBPS = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+
+def _wav_duration(data: bytes) -> Optional[float]:
+    byte_rate = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size = int.from_bytes(data[offset + 4:offset + 8], "little")
+        if chunk_id == b"fmt ":
+            byte_rate = int.from_bytes(data[offset + 16:offset + 20], "little")
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # Streamed WAVs may leave the size unset
+            available = len(data) - offset - 8
+            return min(size, available) / byte_rate if size else available / byte_rate
+        offset += 8 + size + (size & 1)
+    return None
+
+
+def _mp3_duration(data: bytes) -> Optional[float]:
+    offset = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        tag_size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+    # First frame sync within the first 64 KB after the tag
+    limit = min(len(data) - 4, offset + 65536)
+    while offset < limit and not (data[offset] == 0xFF and data[offset + 1] & 0xE0 == 0xE0):
+        offset += 1
+    if offset >= limit:
+        return None
+
+    header = int.from_bytes(data[offset:offset + 4], "big")
+    version = {3: 1, 2: 2, 0: 2.5}.get((header >> 19) & 3)
+    layer = {3: 1, 2: 2, 1: 3}.get((header >> 17) & 3)
+    bitrate_index = (header >> 12) & 0xF
+    rate_index = (header >> 10) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES_KBPS[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    samples_per_frame = 384 if layer == 1 else (1152 if layer == 2 or version == 1 else 576)
+
+    # VBR files carry the frame count in a Xing/Info or VBRI header in the first frame
+    mono = (header >> 6) & 3 == 3
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    pos = offset + 4 + side_info
+    if data[pos:pos + 4] in (b"Xing", b"Info") and int.from_bytes(data[pos + 4:pos + 8], "big") & 1:
+        frames = int.from_bytes(data[pos + 8:pos + 12], "big")
+        return frames * samples_per_frame / sample_rate
+    pos = offset + 36
+    if data[pos:pos + 4] == b"VBRI":
+        frames = int.from_bytes(data[pos + 14:pos + 18], "big")
+        return frames * samples_per_frame / sample_rate
+    # Otherwise assume constant bitrate
+    return (len(data) - offset) * 8 / bitrate
+
+
+def _mp4_duration(data: bytes) -> Optional[float]:
+    def boxes(start: int, end: int):
+        while start + 8 <= end:
+            size = int.from_bytes(data[start:start + 4], "big")
+            box_type = data[start + 4:start + 8]
+            header = 8
+            if size == 1:
+                size = int.from_bytes(data[start + 8:start + 16], "big")
+                header = 16
+            elif size == 0:
+                size = end - start
+            if size < header:
+                return
+            yield box_type, start + header, min(start + size, end)
+            start += size
+
+    for box_type, body, end in boxes(0, len(data)):
+        if box_type != b"moov":
+            continue
+        for child_type, child, _ in boxes(body, end):
+            if child_type != b"mvhd":
+                continue
+            if data[child] == 1:
+                timescale = int.from_bytes(data[child + 20:child + 24], "big")
+                duration = int.from_bytes(data[child + 24:child + 32], "big")
+            else:
+                timescale = int.from_bytes(data[child + 12:child + 16], "big")
+                duration = int.from_bytes(data[child + 16:child + 20], "big")
+            return duration / timescale if timescale else None
+    return None
+
+
+def _flac_duration(data: bytes) -> Optional[float]:
+    # STREAMINFO is always the first metadata block
+    info = data[8:26]
+    if len(info) < 18:
+        return None
+    sample_rate = int.from_bytes(info[10:13], "big") >> 4
+    total_samples = int.from_bytes(info[13:18], "big") & 0xFFFFFFFFF
+    return total_samples / sample_rate if sample_rate and total_samples else None
+
+
+def probe_duration(data: bytes) -> Optional[float]:
+    """
+    Estimates the duration in seconds of an encoded audio file from its
+    headers alone (WAV, MP3, MP4/M4A, FLAC), without decoding any audio.
+    Falls back to libsndfile's header parsing; None if it cannot tell.
+    """
+    try:
+        if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+            return _wav_duration(data)
+        if data[4:8] == b"ftyp":
+            return _mp4_duration(data)
+        if data[:4] == b"fLaC":
+            return _flac_duration(data)
+        if data[:3] == b"ID3" or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+            return _mp3_duration(data)
+    except (IndexError, KeyError, ZeroDivisionError):
+        return None
+
+    import soundfile as sf
+
+    try:
+        info = sf.info(io.BytesIO(data))
+        return info.frames / info.samplerate if info.samplerate else None
+    except Exception:
+        return None
@@ -0,0 +1,67 @@
+# Cooperative cancellation for inference running in worker threads
+#
+# Threads started with asyncio.to_thread cannot be interrupted, so the server
+# hands each computation a CancellationToken. The token is cancelled when the
+# result is no longer wanted (deadline passed, client gone), and the TTS/STT
+# logic checks it between generation steps and stops early.
+
+import threading
+import time
+from typing import Optional
+
+
+class OperationCancelled(Exception):
+    """Raised inside inference code when its cancellation token has fired."""
+
+
+class CancellationToken:
+    """A thread-safe cancel flag with an optional monotonic-clock deadline."""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_timeout(cls, seconds: Optional[float]) -> "CancellationToken":
+        return cls(time.monotonic() + seconds if seconds is not None else None)
+
+    def extend_deadline(self, deadline: Optional[float]):
+        """Pushes the deadline out (never in); None means no deadline."""
+        with self._lock:
+            if self.deadline is None:
+                return
+            self.deadline = None if deadline is None else max(self.deadline, deadline)
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if not self._event.is_set():
+                self.reason = reason
+                self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline, or None if there is none."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """Raises OperationCancelled if the token has been cancelled or the deadline passed."""
+        if self.cancelled:
+            raise OperationCancelled(self.reason)
+
+
+def check(token: Optional[CancellationToken]):
+    """`token.check()` that accepts None, for callers without a token."""
+    if token is not None:
+        token.check()
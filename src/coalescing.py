@@ -0,0 +1,110 @@
+# Single-flight coalescing of identical in-flight requests
+#
+# Identical synthesis/transcription requests that arrive while one is already
+# running attach to the running computation instead of starting their own.
+# Each computation gets a cancellation token that fires, and its task is
+# cancelled (taking it out of the scheduler queue), once nobody is waiting for
+# its result any more.
+
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from . import tracing
+from .cancellation import CancellationToken
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of uploaded content, used as part of a request key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def request_key(kind: str, **fields: Any) -> str:
+    """Builds a canonical key from the request kind and the options that affect its output."""
+    canonical = json.dumps({"kind": kind, **fields}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "token", "leader_id", "waiters")
+
+    def __init__(self, task: asyncio.Task, token: CancellationToken, leader_id: Optional[str]):
+        self.task = task
+        self.token = token
+        self.leader_id = leader_id
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time.
+
+    Callers awaiting `do` with a key that is already in flight share the
+    result (or exception) of the running computation. A caller that gives up
+    (times out, disconnects) does not affect the others; when the last waiter
+    gives up, the computation's cancellation token and task are cancelled.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[CancellationToken], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Awaits the computation for `key`, starting `fn(token)` if none is running.
+        `timeout` sets (or extends) the token's deadline.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        flight = self._in_flight.get(key)
+        leader = flight is None or flight.token.cancelled
+        if leader:
+            token = CancellationToken(deadline)
+            task = asyncio.ensure_future(fn(token))
+            flight = _Flight(task, token, tracing.current_request_id())
+            self._in_flight[key] = flight
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            flight.token.extend_deadline(deadline)
+            print(f"Coalescing request {key[:12]} with in-flight computation of {flight.leader_id}")
+
+        flight.waiters += 1
+        try:
+            # Followers' stage spans are recorded on the leader's trace
+            span = nullcontext() if leader else tracing.span("coalesced_wait", leader=flight.leader_id)
+            with span:
+                return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self.abandoned += 1
+                flight.token.cancel("result no longer wanted")
+                flight.task.cancel()
+                print(f"Cancelling computation {key[:12]}: no requests are waiting for it")
+
+    def _forget(self, key: str, task: asyncio.Task):
+        flight = self._in_flight.get(key)
+        if flight is not None and flight.task is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter gave up
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
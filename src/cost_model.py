@@ -0,0 +1,109 @@
+# Online cost model for inference jobs
+#
+# Learns how long each model takes per unit of work from observed runs:
+# seconds per input token for TTS models and seconds per second of audio for
+# STT models. Each (model, unit) pair keeps an exponentially weighted moving
+# average, seeded with a conservative prior until the first observation. The
+# scheduler uses the estimates to order jobs and to predict completion times.
+
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOKENS = "tokens"
+AUDIO_SECONDS = "audio_seconds"
+
+# Priors, in seconds per unit, used before a model has been observed
+DEFAULT_SECONDS_PER_UNIT = {
+    TOKENS: 0.2,
+    AUDIO_SECONDS: 0.1,
+}
+
+# Weight of the newest observation in the moving average
+COST_EWMA_ALPHA = float(os.getenv("COST_EWMA_ALPHA", "0.2"))
+
+# Words, plus single CJK characters (which are not separated by spaces)
+_CJK = "\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af"
+_TOKEN_PATTERN = re.compile(f"[{_CJK}]|[^\\s{_CJK}]+")
+
+
+def count_tokens(text: str) -> int:
+    """Cheap token count for cost estimation (not the model's own tokenizer)."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+class _Rate:
+    __slots__ = ("seconds_per_unit", "observations")
+
+    def __init__(self, seconds_per_unit: float):
+        self.seconds_per_unit = seconds_per_unit
+        self.observations = 0
+
+
+class CostEstimator:
+    """Per-model EWMA of seconds per unit of work."""
+
+    def __init__(self, alpha: float = COST_EWMA_ALPHA):
+        self.alpha = alpha
+        self._rates: Dict[Tuple[str, str], _Rate] = {}
+        self._lock = threading.Lock()
+
+    def seconds_per_unit(self, model: str, unit: str) -> float:
+        with self._lock:
+            rate = self._rates.get((model, unit))
+            return rate.seconds_per_unit if rate else DEFAULT_SECONDS_PER_UNIT[unit]
+
+    def observed(self, model: str, unit: str) -> bool:
+        """Whether the rate for `model` comes from measured runs rather than the prior."""
+        with self._lock:
+            return (model, unit) in self._rates
+
+    def estimate(self, model: str, units: float, unit: str) -> float:
+        """Expected seconds for `units` of work on `model`."""
+        return max(units, 0.0) * self.seconds_per_unit(model, unit)
+
+    def observe(self, model: str, units: float, unit: str, seconds: float):
+        """Folds a measured run into the model's rate; runs with no work are ignored."""
+        if units <= 0 or seconds < 0:
+            return
+        observed = seconds / units
+        with self._lock:
+            rate = self._rates.get((model, unit))
+            if rate is None:
+                # The first observation replaces the prior outright
+                rate = self._rates[(model, unit)] = _Rate(observed)
+            else:
+                rate.seconds_per_unit += self.alpha * (observed - rate.seconds_per_unit)
+            rate.observations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models: Dict[str, Dict[str, Any]] = {}
+            for (model, unit), rate in self._rates.items():
+                models.setdefault(model, {})[f"seconds_per_{unit.rstrip('s')}"] = {
+                    "value": round(rate.seconds_per_unit, 4),
+                    "observations": rate.observations,
+                }
+            return {
+                "alpha": self.alpha,
+                "priors": {f"seconds_per_{unit.rstrip('s')}": value for unit, value in DEFAULT_SECONDS_PER_UNIT.items()},
+                "models": models,
+            }
+
+
+estimator = CostEstimator()
+
+
+@contextmanager
+def measure(model: str, units: float, unit: str):
+    """Times the enclosed model run and feeds it to the estimator if it completes."""
+    start = time.perf_counter()
+    yield
+    estimator.observe(model, units, unit, time.perf_counter() - start)
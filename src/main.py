@@ -1,19 +1,42 @@
 import asyncio
-from fastapi.responses import StreamingResponse
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form
+import time
+from contextlib import asynccontextmanager
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 
 from . import models
 from . import security
+from . import memory_manager
+from . import coalescing
+from . import cost_model
+from . import audio_io
+from . import tracing
+from . import profiling
+from . import cancellation
+from . import ref_audio as ref_audio_prep
+from . import render_cache
+from . import scheduler
+from . import tts_engines
 from . import tts_logic
+from . import warmup
 from . import stt_logic
+from . import stt_models
 import io
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Import mlx / mlx-audio in the background so the server binds right away
+    warmup.warmup.start()
+    yield
+
+
 app = FastAPI(
     title="Mac Dia Server - OpenAI TTS Compatible API",
     description="Provides a TTS endpoint using mlx-audio backend.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Enable CORS for local HTML file access
@@ -25,26 +48,196 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Per-request stage tracing (Server-Timing header + JSON trace log); probes are not traced
+app.add_middleware(tracing.TracingMiddleware, exclude_paths=("/healthz", "/readyz"))
+
+
+# Identical requests that arrive while one is already generating share its result
+inflight = coalescing.SingleFlight()
+
+# How often a waiting request checks whether its client has gone away
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its result was ready."""
+
+
+async def _unless_disconnected(http_request: Request, awaitable):
+    """
+    Awaits `awaitable`, giving up as soon as the client disconnects. Giving up
+    cancels the wait, which in turn cancels the computation's token once no
+    other request is waiting for it.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _client_gone() -> Response:
+    print(f"Client disconnected; abandoned request {tracing.current_request_id()}")
+    # 499 (client closed request); nobody will read it, but it shows up in the trace
+    return Response(status_code=499)
+
+
+async def _run_in_thread(func, *args, **kwargs):
+    """
+    Runs a blocking function in a worker thread, tracing how long it waited
+    for a thread. If cancelled, waits for the thread to finish before raising.
+    """
+    submitted = time.perf_counter()
+
+    def run():
+        tracing.record_span("queue_wait", submitted, time.perf_counter())
+        with profiling.inference_thread(tracing.current_request_id(), func.__name__):
+            return func(*args, **kwargs)
+
+    thread = asyncio.ensure_future(asyncio.to_thread(run))
+    try:
+        return await asyncio.shield(thread)
+    except asyncio.CancelledError:
+        # The thread cannot be interrupted; it stops at its next cancellation
+        # check, and keeps holding its scheduler slot until then
+        while not thread.done():
+            try:
+                await asyncio.wait({thread})
+            except asyncio.CancelledError:
+                pass
+        if not thread.cancelled():
+            thread.exception()
+        raise
+
+
+def _deadline(token: Optional[cancellation.CancellationToken]) -> Optional[float]:
+    return token.deadline if token is not None else None
+
+
+async def _synthesize(func, *args, cost: tuple[str, float], **kwargs) -> tuple[bytes, str]:
+    """
+    Runs a blocking synthesis function in a worker thread once the scheduler
+    admits it, and returns the audio bytes. `cost` is (model, input tokens).
+    """
+    model, tokens = cost
+    token = kwargs.get("cancel_token")
+    async with scheduler.scheduler.slot(func.__name__, model, tokens, cost_model.TOKENS, deadline=_deadline(token)):
+        # The token may have fired while the job was queued
+        cancellation.check(token)
+        audio_buffer, content_type = await _run_in_thread(func, *args, **kwargs)
+    return audio_buffer.getvalue(), content_type
+
+
+async def _synthesize_long(
+    text: str,
+    ref_audio: bytes,
+    ref_text: Optional[str],
+    output_format: str,
+    speed: float,
+    max_words_per_chunk: int,
+    cancel_token: cancellation.CancellationToken,
+) -> tuple[bytes, str]:
+    """
+    Long-form voice cloning. The chunk loop runs here on the event loop and
+    each chunk is scheduled on its own, so shorter jobs run between chunks;
+    only the generation itself occupies a worker thread, never the wait.
+    """
+    chunks = tts_logic.chunk_text(text, max_words=max_words_per_chunk)
+    print(f"Long-form voice cloning: {len(chunks)} chunks")
+    if len(chunks) == 1:
+        return await _synthesize(
+            tts_logic.generate_cloned_speech_sync,
+            cost=(tts_logic.CLONE_MODEL, cost_model.count_tokens(chunks[0])),
+            text=chunks[0],
+            ref_audio=ref_audio,
+            ref_text=ref_text,
+            output_format=output_format,
+            speed=speed,
+            cancel_token=cancel_token,
+        )
+
+    ref_samples, clip_text = await _run_in_thread(
+        tts_logic.load_long_form_reference, ref_audio, ref_text, cancel_token
+    )
+    chunk_audio = []
+    sample_rate = None
+    for i, chunk in enumerate(chunks):
+        async with scheduler.scheduler.slot(
+            "generate_long_form_chunk", tts_logic.CLONE_MODEL, cost_model.count_tokens(chunk), cost_model.TOKENS
+        ):
+            audio, sample_rate = await _run_in_thread(
+                tts_logic.generate_long_form_chunk, chunk, i, len(chunks), ref_samples, clip_text, cancel_token
+            )
+        chunk_audio.append(audio)
+
+    audio_buffer, content_type = await _run_in_thread(
+        tts_logic.finish_long_form, chunk_audio, sample_rate, output_format, speed
+    )
+    return audio_buffer.getvalue(), content_type
+
+
+def _speech_cost(request: models.TTSRequest) -> tuple[str, float]:
+    """Expected work for a speech request; none if its 1.0x render is already cached."""
+    model = tts_engines.engine_for(request.model).name
+    if render_cache.cache.contains(tts_logic.speech_render_key(request)):
+        return model, 0
+    return model, cost_model.count_tokens(request.input)
+
+
+async def _transcribe(route: str, audio: bytes, audio_seconds: float, **kwargs):
+    """
+    Transcribes in a worker thread once one of the route's concurrency slots
+    is free and the scheduler admits the job.
+    """
+    model_name = stt_models.model_for(route)
+    token = kwargs.get("cancel_token")
+    async with stt_models.slot(route):
+        async with scheduler.scheduler.slot(
+            "transcribe_audio_sync", model_name, audio_seconds, cost_model.AUDIO_SECONDS, deadline=_deadline(token)
+        ):
+            # The token may have fired while the job was queued
+            cancellation.check(token)
+            return await _run_in_thread(
+                stt_logic.transcribe_audio_sync, audio, model_name=model_name, audio_seconds=audio_seconds, **kwargs
+            )
+
+
 @app.post(
     "/v1/audio/speech",
     response_description="Audio stream in the requested format",
     tags=["TTS"],
 )
-async def create_speech(request: models.TTSRequest):
+async def create_speech(request: models.TTSRequest, http_request: Request):
     """Handles the text-to-speech request, compatible with OpenAI's API."""
+    key = coalescing.request_key(
+        "speech",
+        model=request.model,
+        input=request.input,
+        voice=request.voice,
+        speed=request.speed,
+        response_format=request.response_format,
+    )
     try:
         # Run the potentially blocking TTS generation in a separate thread with 60s timeout
-        audio_buffer, content_type = await asyncio.wait_for(
-            asyncio.to_thread(
-                tts_logic.generate_speech_from_text_sync, request
-            ),
+        audio_content, content_type = await asyncio.wait_for(
+            _unless_disconnected(http_request, inflight.do(
+                key,
+                lambda token: _synthesize(
+                    tts_logic.generate_speech_from_text_sync, request, cost=_speech_cost(request), cancel_token=token
+                ),
+                timeout=60.0
+            )),
             timeout=60.0
         )
 
-        # Reset buffer position to the beginning before streaming
-        audio_buffer.seek(0)
-
-        return StreamingResponse(audio_buffer, media_type=content_type)
+        return StreamingResponse(io.BytesIO(audio_content), media_type=content_type)
 
     except asyncio.TimeoutError:
         print("TTS generation timed out after 60 seconds")
@@ -52,6 +245,26 @@ async def create_speech(request: models.TTSRequest):
             status_code=408,
             detail="Request timed out after 60 seconds"
         )
+    except ClientDisconnected:
+        return _client_gone()
+    except cancellation.OperationCancelled as e:
+        print(f"Request cancelled: {e}")
+        raise HTTPException(
+            status_code=408,
+            detail=f"Request cancelled: {e}"
+        )
+    except scheduler.SchedulerOverloaded as e:
+        print(f"Rejected at admission: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except memory_manager.MemoryBudgetExceeded as e:
+        print(f"Memory budget exceeded: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
     except Exception as e:
         # Basic error handling, might need refinement
         print(f"Error during TTS generation: {e}")
@@ -67,6 +280,7 @@ async def create_speech(request: models.TTSRequest):
     tags=["TTS"],
 )
 async def create_cloned_speech(
+    http_request: Request,
     input: str = Form(..., description="The text to synthesize"),
     ref_audio: UploadFile = File(..., description="Reference audio file for voice cloning (~10 seconds recommended)"),
     ref_text: Optional[str] = Form(None, description="Transcript of the reference audio (optional, will auto-transcribe if not provided)"),
@@ -79,9 +293,6 @@ async def create_cloned_speech(
     Upload a reference audio file (~10 seconds of clear speech recommended) 
     and the text you want synthesized in that voice.
     """
-    import tempfile
-    import os
-    
     # Validate speed
     if speed < 0.25 or speed > 4.0:
         raise HTTPException(status_code=400, detail="Speed must be between 0.25 and 4.0")
@@ -94,38 +305,38 @@ async def create_cloned_speech(
             detail=f"Invalid response_format. Supported formats: {', '.join(valid_formats)}"
         )
     
-    # Save uploaded reference audio to temp file
-    ref_audio_content = await ref_audio.read()
-    
-    # Get file extension from uploaded file
-    ref_ext = ref_audio.filename.split(".")[-1].lower() if ref_audio.filename and "." in ref_audio.filename else "mp3"
-    
-    # Create temp file for reference audio
-    temp_ref_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{ref_ext}")
-    temp_ref_path = temp_ref_file.name
+    with tracing.span("upload_read"):
+        ref_audio_content = await ref_audio.read()
+    key = coalescing.request_key(
+        "clone",
+        input=input,
+        ref_audio=coalescing.content_hash(ref_audio_content),
+        ref_text=ref_text,
+        response_format=response_format,
+        speed=speed,
+    )
     
     try:
-        # Write reference audio to temp file
-        temp_ref_file.write(ref_audio_content)
-        temp_ref_file.close()
-        
-        print(f"Saved reference audio to: {temp_ref_path} ({len(ref_audio_content)} bytes)")
-        
         # Run voice cloning TTS with 120s timeout (voice cloning takes longer)
-        audio_buffer, content_type = await asyncio.wait_for(
-            asyncio.to_thread(
-                tts_logic.generate_cloned_speech_sync,
-                text=input,
-                ref_audio_path=temp_ref_path,
-                ref_text=ref_text,
-                output_format=response_format,
-                speed=speed
-            ),
+        audio_content, content_type = await asyncio.wait_for(
+            _unless_disconnected(http_request, inflight.do(
+                key,
+                lambda token: _synthesize(
+                    tts_logic.generate_cloned_speech_sync,
+                    cost=(tts_logic.CLONE_MODEL, cost_model.count_tokens(input)),
+                    text=input,
+                    ref_audio=ref_audio_content,
+                    ref_text=ref_text,
+                    output_format=response_format,
+                    speed=speed,
+                    cancel_token=token
+                ),
+                timeout=120.0
+            )),
             timeout=120.0
         )
         
-        audio_buffer.seek(0)
-        return StreamingResponse(audio_buffer, media_type=content_type)
+        return StreamingResponse(io.BytesIO(audio_content), media_type=content_type)
     
     except asyncio.TimeoutError:
         print("Voice cloning timed out after 120 seconds")
@@ -133,18 +344,38 @@ async def create_cloned_speech(
             status_code=408,
             detail="Voice cloning request timed out after 120 seconds"
         )
+    except ClientDisconnected:
+        return _client_gone()
+    except cancellation.OperationCancelled as e:
+        print(f"Request cancelled: {e}")
+        raise HTTPException(
+            status_code=408,
+            detail=f"Request cancelled: {e}"
+        )
+    except ref_audio_prep.InvalidReferenceAudio as e:
+        print(f"Invalid reference audio: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except scheduler.SchedulerOverloaded as e:
+        print(f"Rejected at admission: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except memory_manager.MemoryBudgetExceeded as e:
+        print(f"Memory budget exceeded: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
     except Exception as e:
         print(f"Error during voice cloning: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate cloned audio: {str(e)}"
         )
-    finally:
-        # Clean up temp reference audio file
-        try:
-            os.remove(temp_ref_path)
-        except Exception as e:
-            print(f"Warning: Could not delete temp reference file {temp_ref_path}: {e}")
 
 
 @app.post(
@@ -153,6 +384,7 @@ async def create_cloned_speech(
     tags=["TTS"],
 )
 async def create_cloned_speech_long(
+    http_request: Request,
     input: str = Form(..., description="The full text to synthesize (2000-20000+ words supported)"),
     ref_audio: UploadFile = File(..., description="Reference audio file for voice cloning (~10 seconds recommended)"),
     ref_text: Optional[str] = Form(None, description="Transcript of the reference audio (optional)"),
@@ -170,9 +402,6 @@ async def create_cloned_speech_long(
     
     Note: This endpoint has a longer timeout (30 minutes) for large texts.
     """
-    import tempfile
-    import os
-    
     # Validate speed
     if speed < 0.25 or speed > 4.0:
         raise HTTPException(status_code=400, detail="Speed must be between 0.25 and 4.0")
@@ -189,39 +418,45 @@ async def create_cloned_speech_long(
             detail=f"Invalid response_format. Supported formats: {', '.join(valid_formats)}"
         )
     
-    # Save uploaded reference audio to temp file
-    ref_audio_content = await ref_audio.read()
-    ref_ext = ref_audio.filename.split(".")[-1].lower() if ref_audio.filename and "." in ref_audio.filename else "mp3"
+    with tracing.span("upload_read"):
+        ref_audio_content = await ref_audio.read()
+    key = coalescing.request_key(
+        "clone_long",
+        input=input,
+        ref_audio=coalescing.content_hash(ref_audio_content),
+        ref_text=ref_text,
+        response_format=response_format,
+        speed=speed,
+        max_words_per_chunk=max_words_per_chunk,
+    )
+    
+    word_count = len(input.split())
+    print(f"Long-form clone request: {word_count} words")
     
-    temp_ref_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{ref_ext}")
-    temp_ref_path = temp_ref_file.name
+    # Calculate timeout based on word count (roughly 2 seconds per word + buffer)
+    timeout_seconds = max(300, word_count * 2)  # Minimum 5 minutes
+    timeout_seconds = min(timeout_seconds, 1800)  # Maximum 30 minutes
     
     try:
-        temp_ref_file.write(ref_audio_content)
-        temp_ref_file.close()
-        
-        word_count = len(input.split())
-        print(f"Long-form clone request: {word_count} words, ref_audio: {temp_ref_path}")
-        
-        # Calculate timeout based on word count (roughly 2 seconds per word + buffer)
-        timeout_seconds = max(300, word_count * 2)  # Minimum 5 minutes
-        timeout_seconds = min(timeout_seconds, 1800)  # Maximum 30 minutes
-        
-        audio_buffer, content_type = await asyncio.wait_for(
-            asyncio.to_thread(
-                tts_logic.generate_cloned_speech_long_sync,
-                text=input,
-                ref_audio_path=temp_ref_path,
-                ref_text=ref_text,
-                output_format=response_format,
-                speed=speed,
-                max_words_per_chunk=max_words_per_chunk
-            ),
+        audio_content, content_type = await asyncio.wait_for(
+            _unless_disconnected(http_request, inflight.do(
+                key,
+                # Scheduled chunk by chunk, so short requests are not stuck behind it
+                lambda token: _synthesize_long(
+                    text=input,
+                    ref_audio=ref_audio_content,
+                    ref_text=ref_text,
+                    output_format=response_format,
+                    speed=speed,
+                    max_words_per_chunk=max_words_per_chunk,
+                    cancel_token=token,
+                ),
+                timeout=timeout_seconds
+            )),
             timeout=timeout_seconds
         )
         
-        audio_buffer.seek(0)
-        return StreamingResponse(audio_buffer, media_type=content_type)
+        return StreamingResponse(io.BytesIO(audio_content), media_type=content_type)
     
     except asyncio.TimeoutError:
         print(f"Long-form voice cloning timed out after {timeout_seconds} seconds")
@@ -229,17 +464,38 @@ async def create_cloned_speech_long(
             status_code=408,
             detail=f"Request timed out after {timeout_seconds} seconds"
         )
+    except ClientDisconnected:
+        return _client_gone()
+    except cancellation.OperationCancelled as e:
+        print(f"Request cancelled: {e}")
+        raise HTTPException(
+            status_code=408,
+            detail=f"Request cancelled: {e}"
+        )
+    except ref_audio_prep.InvalidReferenceAudio as e:
+        print(f"Invalid reference audio: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except scheduler.SchedulerOverloaded as e:
+        print(f"Rejected at admission: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except memory_manager.MemoryBudgetExceeded as e:
+        print(f"Memory budget exceeded: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
     except Exception as e:
         print(f"Error during long-form voice cloning: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate cloned audio: {str(e)}"
         )
-    finally:
-        try:
-            os.remove(temp_ref_path)
-        except Exception as e:
-            print(f"Warning: Could not delete temp reference file {temp_ref_path}: {e}")
 
 @app.post(
     "/v1/audio/transcriptions",
@@ -247,8 +503,9 @@ async def create_cloned_speech_long(
     tags=["STT"],
 )
 async def create_transcription(
+    http_request: Request,
     file: UploadFile = File(...),
-    model: Optional[str] = Form("mlx-community/whisper-large-v3-turbo"),
+    model: Optional[str] = Form(None, description="Whisper route, its repo name, or 'auto' (default) to pick by duration"),
     language: Optional[str] = Form(None),
     prompt: Optional[str] = Form(None),
     response_format: Optional[str] = Form("json"),
@@ -257,10 +514,8 @@ async def create_transcription(
     """Handles the speech-to-text request, compatible with OpenAI's API."""
     try:
         # Read file content
-        file_content = await file.read()
-
-        # Create memory buffer from file content
-        audio_buffer = io.BytesIO(file_content)
+        with tracing.span("upload_read"):
+            file_content = await file.read()
 
         # Validate supported formats
         valid_formats = ["mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm"]
@@ -272,16 +527,40 @@ async def create_transcription(
                 detail=f"Unsupported file format. Supported formats are: {', '.join(valid_formats)}"
             )
 
+        route, duration = stt_models.resolve(model, file_content)
+        model_name = stt_models.model_for(route)
+        if duration is None:
+            duration = audio_io.probe_duration(file_content)
+        # Unknown durations are guessed from the size, assuming ~128 kbit/s
+        audio_seconds = duration if duration is not None else len(file_content) / 16000
+        print(f"Transcription routed to {model_name}" + (f" ({duration:.1f}s of audio)" if duration is not None else ""))
+
+        # Identical uploads with identical options share one transcription;
+        # response_format is applied afterwards, so it is not part of the key
+        key = coalescing.request_key(
+            "transcription",
+            file=coalescing.content_hash(file_content),
+            model=model_name,
+            language=language,
+            prompt=prompt,
+            temperature=temperature,
+        )
+
         # Run the potentially blocking STT processing in a separate thread with 60s timeout
         result = await asyncio.wait_for(
-            asyncio.to_thread(
-                stt_logic.transcribe_audio_sync,
-                audio_buffer,
-                model_name="mlx-community/whisper-large-v3-turbo",
-                language=language,
-                prompt=prompt,
-                temperature=temperature,
-            ),
+            _unless_disconnected(http_request, inflight.do(
+                key,
+                lambda token: _transcribe(
+                    route,
+                    file_content,
+                    audio_seconds,
+                    language=language,
+                    prompt=prompt,
+                    temperature=temperature,
+                    cancel_token=token,
+                ),
+                timeout=60.0
+            )),
             timeout=60.0
         )
 
@@ -300,6 +579,26 @@ async def create_transcription(
             status_code=408,
             detail="Request timed out after 60 seconds"
         )
+    except ClientDisconnected:
+        return _client_gone()
+    except cancellation.OperationCancelled as e:
+        print(f"Request cancelled: {e}")
+        raise HTTPException(
+            status_code=408,
+            detail=f"Request cancelled: {e}"
+        )
+    except scheduler.SchedulerOverloaded as e:
+        print(f"Rejected at admission: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
+    except memory_manager.MemoryBudgetExceeded as e:
+        print(f"Memory budget exceeded: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e)
+        )
     except Exception as e:
         print(f"Error during STT processing: {e}")
         raise HTTPException(
@@ -309,11 +608,141 @@ async def create_transcription(
 
 
 
+@app.get(
+    "/v1/memory",
+    dependencies=[Depends(security.get_api_key)],
+    tags=["General"],
+)
+async def read_memory_stats():
+    """Reports memory budget, current usage, high-water marks, resident models and the render cache."""
+    return {**memory_manager.manager.stats(), "render_cache": render_cache.cache.stats()}
+
+
+@app.get(
+    "/v1/stt/models",
+    dependencies=[Depends(security.get_api_key)],
+    tags=["STT"],
+)
+async def read_stt_models():
+    """Reports the STT routes, the auto routing policy and per-model concurrency."""
+    return stt_models.stats()
+
+
+@app.get(
+    "/v1/queue",
+    dependencies=[Depends(security.get_api_key)],
+    tags=["General"],
+)
+async def read_queue():
+    """
+    Reports running and queued inference jobs with predicted completion times,
+    the learned cost model and request coalescing counters.
+    """
+    return {**scheduler.scheduler.status(), "coalescing": inflight.stats()}
+
+
+def _require_debug_endpoints():
+    """Hides the debug endpoints unless DEBUG_ENDPOINTS_ENABLED is set."""
+    if not profiling.DEBUG_ENDPOINTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+debug_dependencies = [Depends(_require_debug_endpoints), Depends(security.get_api_key)]
+
+
+@app.post("/debug/profile/start", dependencies=debug_dependencies, tags=["Debug"])
+async def start_cpu_profile(requests: Optional[int] = None, seconds: Optional[float] = None):
+    """
+    Starts the sampling CPU profiler on the inference threads for the next
+    `requests` inference calls or `seconds` seconds, whichever comes first
+    (30 seconds if neither is given).
+    """
+    if requests is not None and requests < 1:
+        raise HTTPException(status_code=400, detail="requests must be at least 1")
+    if seconds is not None and seconds <= 0:
+        raise HTTPException(status_code=400, detail="seconds must be positive")
+    try:
+        profile = profiling.sampler.start(max_requests=requests, max_seconds=seconds)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profile.summary()
+
+
+@app.post("/debug/profile/stop", dependencies=debug_dependencies, tags=["Debug"])
+async def stop_cpu_profile():
+    """Stops the running CPU profile early."""
+    profile = await asyncio.to_thread(profiling.sampler.stop)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No CPU profile has been recorded")
+    return profile.summary()
+
+
+@app.get("/debug/profile", dependencies=debug_dependencies, tags=["Debug"])
+async def read_profile_status():
+    """Reports the running and last finished CPU profiles and tracemalloc state."""
+    return profiling.profile_status()
+
+
+@app.get("/debug/profile/download", dependencies=debug_dependencies, tags=["Debug"])
+async def download_cpu_profile(format: str = "collapsed"):
+    """Downloads the last finished CPU profile as collapsed stacks or a pstats file."""
+    if format not in ("collapsed", "pstats"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'pstats'")
+    profile = profiling.sampler.last
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No finished CPU profile available")
+    content, media_type, filename = profiling.export_profile(profile, format)
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/debug/tracemalloc/start", dependencies=debug_dependencies, tags=["Debug"])
+async def start_tracemalloc(frames: int = 25):
+    """Starts tracemalloc and records a snapshot diff for every inference call."""
+    await asyncio.to_thread(profiling.allocations.start, frames)
+    return profiling.profile_status()["tracemalloc"]
+
+
+@app.post("/debug/tracemalloc/stop", dependencies=debug_dependencies, tags=["Debug"])
+async def stop_tracemalloc():
+    """Stops tracemalloc, removing its overhead from the request path."""
+    profiling.allocations.stop()
+    return profiling.profile_status()["tracemalloc"]
+
+
+@app.get("/debug/tracemalloc", dependencies=debug_dependencies, tags=["Debug"])
+async def read_tracemalloc(top: int = 25):
+    """Returns allocation growth since tracemalloc was started, and per-request diffs."""
+    if not profiling.allocations.active:
+        raise HTTPException(status_code=409, detail="tracemalloc is not running")
+    baseline_diff = await asyncio.to_thread(profiling.allocations.diff_from_baseline, top)
+    return {
+        "since_start": baseline_diff,
+        "requests": list(profiling.allocations.per_request),
+    }
+
+
 # Optional: Add a root endpoint for basic health check or info
 @app.get("/", tags=["General"])
 async def read_root():
     return {"message": "Mac Dia Server is running. Use POST /v1/audio/speech for TTS."}
 
+
+@app.get("/healthz", tags=["General"])
+async def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz", tags=["General"])
+async def readiness():
+    """Readiness probe: 200 once the inference backends have been imported, 503 until then."""
+    status = warmup.warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 # 添加这个函数作为入口点
 def start_server():
     import uvicorn
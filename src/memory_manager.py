@@ -0,0 +1,378 @@
+# Memory budget manager for resident TTS/STT models
+#
+# Models are kept loaded between requests and only collected or evicted when
+# the process approaches its configured memory budget. Loads that would push
+# the process over budget wait for memory to be released, or are refused.
+# A resident model is one shared instance, so each model is used by at most
+# max_concurrency threads at a time (default 1).
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from . import tracing
+
+load_dotenv()
+
+MB = 1024 * 1024
+
+# Rough footprints used before a model has been loaded once; afterwards the
+# measured parameter size is used instead.
+DEFAULT_MODEL_ESTIMATES_MB = {
+    "mlx-community/Dia-1.6B-fp16": 3600,
+    "mlx-community/Kokoro-82M-bf16": 400,
+    "mlx-community/csm-1b": 3000,
+    "mlx-community/whisper-large-v3-turbo": 1700,
+    "mlx-community/whisper-small-mlx": 500,
+}
+DEFAULT_MODEL_ESTIMATE_MB = 2048
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """Raised when a model cannot be loaded without exceeding the memory budget."""
+
+
+class _ResidentModel:
+    __slots__ = ("name", "model", "size_bytes", "refcount", "last_used")
+
+    def __init__(self, name: str, model: Any, size_bytes: int):
+        self.name = name
+        self.model = model
+        self.size_bytes = size_bytes
+        self.refcount = 0
+        self.last_used = time.time()
+
+
+def _physical_memory_bytes() -> Optional[int]:
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def process_rss_bytes() -> int:
+    """Returns the current resident set size of this process."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    # Last resort: peak RSS (bytes on macOS, kilobytes on Linux)
+    import resource
+    import sys
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _mlx_memory_fn(name: str) -> Optional[Callable]:
+    try:
+        import mlx.core as mx
+    except ImportError:
+        return None
+    fn = getattr(mx, name, None)
+    if fn is None and hasattr(mx, "metal"):
+        fn = getattr(mx.metal, name, None)
+    return fn
+
+
+def accelerator_memory_bytes() -> Dict[str, int]:
+    """Returns MLX active/cache/peak allocation sizes (zeros if MLX is unavailable)."""
+    stats = {}
+    for key, fn_name in (("active", "get_active_memory"), ("cache", "get_cache_memory"), ("peak", "get_peak_memory")):
+        fn = _mlx_memory_fn(fn_name)
+        stats[key] = int(fn()) if fn else 0
+    return stats
+
+
+def clear_accelerator_cache():
+    fn = _mlx_memory_fn("clear_cache")
+    if fn:
+        fn()
+
+
+def model_nbytes(model: Any) -> int:
+    """Sums the parameter sizes of an MLX module; 0 if it cannot be measured."""
+    try:
+        from mlx.utils import tree_flatten
+        return sum(v.nbytes for _, v in tree_flatten(model.parameters()))
+    except Exception:
+        return 0
+
+
+class MemoryManager:
+    """
+    Tracks resident models and process memory against a budget.
+
+    Models are loaded through `use_model`, which keeps them cached after the
+    request finishes. Idle models are evicted least-recently-used first, and
+    only when memory is actually needed; pinned models are not evicted.
+    Callers of `use_model` for the same model are serialized, up to its
+    max concurrency.
+    """
+
+    def __init__(self, budget_bytes: int, pressure_ratio: float = 0.85, load_timeout: float = 30.0):
+        self.budget_bytes = budget_bytes
+        self.pressure_ratio = pressure_ratio
+        self.load_timeout = load_timeout
+
+        self._cond = threading.Condition()
+        self._models: "OrderedDict[str, _ResidentModel]" = OrderedDict()
+        self._loading: set[str] = set()
+        self._size_hints: Dict[str, int] = {}
+        # Models kept resident even when idle under memory pressure
+        self._pinned: set[str] = set()
+        # Limits on simultaneous users of one model instance, and their semaphores
+        self._max_concurrency: Dict[str, int] = {}
+        self._gates: Dict[str, threading.Semaphore] = {}
+
+        self._rss_high_water = 0
+        self._accelerator_high_water = 0
+        self._model_bytes_high_water = 0
+        self._collections = 0
+        self._evictions = 0
+        self._refused_loads = 0
+
+    @classmethod
+    def from_env(cls) -> "MemoryManager":
+        budget_mb = os.getenv("MEMORY_BUDGET_MB")
+        if budget_mb:
+            budget_bytes = int(float(budget_mb) * MB)
+        else:
+            # Default to 75% of physical memory, shared by the worker processes
+            physical = _physical_memory_bytes()
+            workers = max(1, int(os.getenv("WORKERS", "1")))
+            budget_bytes = int(physical * 0.75 / workers) if physical else 0
+        return cls(
+            budget_bytes=budget_bytes,
+            pressure_ratio=float(os.getenv("MEMORY_PRESSURE_RATIO", "0.85")),
+            load_timeout=float(os.getenv("MEMORY_LOAD_TIMEOUT", "30")),
+        )
+
+    # ----------------------
+    # Measurement
+    # ----------------------
+    def usage_bytes(self) -> int:
+        """Process RSS plus MLX allocations; also updates the high-water marks."""
+        rss = process_rss_bytes()
+        accelerator = accelerator_memory_bytes()
+        accelerator_bytes = accelerator["active"] + accelerator["cache"]
+        self._rss_high_water = max(self._rss_high_water, rss)
+        self._accelerator_high_water = max(self._accelerator_high_water, accelerator["peak"], accelerator_bytes)
+        return rss + accelerator_bytes
+
+    def _resident_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._models.values())
+
+    def _estimate_bytes(self, name: str) -> int:
+        if name in self._size_hints:
+            return self._size_hints[name]
+        return DEFAULT_MODEL_ESTIMATES_MB.get(name, DEFAULT_MODEL_ESTIMATE_MB) * MB
+
+    # ----------------------
+    # Model residency
+    # ----------------------
+    @contextmanager
+    def use_model(self, name: str, loader: Callable[[str], Any]):
+        """
+        Yields the resident model `name`, loading it with `loader(name)` if needed,
+        once fewer than its max concurrency of other threads are using it.
+        Raises MemoryBudgetExceeded if the load does not fit within the budget.
+        """
+        with tracing.span("model_acquire", model=name):
+            entry = self._acquire(name, loader)
+        try:
+            gate = self._gate(name)
+            if not gate.acquire(blocking=False):
+                with tracing.span("model_wait", model=name):
+                    gate.acquire()
+            try:
+                yield entry.model
+            finally:
+                gate.release()
+        finally:
+            with self._cond:
+                entry.refcount -= 1
+                entry.last_used = time.time()
+                self._cond.notify_all()
+
+    def set_max_concurrency(self, name: str, limit: int):
+        """
+        Lets up to `limit` threads use model `name` at once; call it before the
+        model is first used. Only raise it for models whose inference is safe
+        to run concurrently on one instance.
+        """
+        with self._cond:
+            self._max_concurrency[name] = max(1, limit)
+            self._gates.pop(name, None)
+
+    def _gate(self, name: str) -> threading.Semaphore:
+        with self._cond:
+            gate = self._gates.get(name)
+            if gate is None:
+                gate = self._gates[name] = threading.Semaphore(self._max_concurrency.get(name, 1))
+            return gate
+
+    def _acquire(self, name: str, loader: Callable[[str], Any]) -> _ResidentModel:
+        deadline = time.monotonic() + self.load_timeout
+        with self._cond:
+            while True:
+                entry = self._models.get(name)
+                if entry is not None:
+                    entry.refcount += 1
+                    self._models.move_to_end(name)
+                    return entry
+
+                if name not in self._loading:
+                    needed = self._estimate_bytes(name)
+                    if self._make_room(needed):
+                        self._loading.add(name)
+                        break
+                    if not self._loading and all(e.refcount == 0 for e in self._models.values()):
+                        # Nothing in flight will ever release memory for us
+                        self._refused_loads += 1
+                        raise MemoryBudgetExceeded(
+                            f"Loading {name} (~{needed // MB} MB) would exceed the memory budget "
+                            f"of {self.budget_bytes // MB} MB"
+                        )
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._refused_loads += 1
+                    raise MemoryBudgetExceeded(
+                        f"Timed out after {self.load_timeout:g}s waiting for memory to load {name}"
+                    )
+                print(f"Waiting for memory to load model {name}...")
+                self._cond.wait(remaining)
+
+        try:
+            print(f"Loading model {name}")
+            with tracing.span("model_load", model=name):
+                model = loader(name)
+        except BaseException:
+            with self._cond:
+                self._loading.discard(name)
+                self._cond.notify_all()
+            raise
+
+        size_bytes = model_nbytes(model) or self._estimate_bytes(name)
+        with self._cond:
+            self._loading.discard(name)
+            entry = _ResidentModel(name, model, size_bytes)
+            entry.refcount = 1
+            self._models[name] = entry
+            self._size_hints[name] = size_bytes
+            self._model_bytes_high_water = max(self._model_bytes_high_water, self._resident_bytes())
+            self._cond.notify_all()
+        self.usage_bytes()
+        print(f"Model {name} resident ({size_bytes // MB} MB)")
+        return entry
+
+    def _projected_bytes(self, needed: int) -> int:
+        """
+        Usage after loading `needed` more bytes. Resident model sizes act as a
+        floor because MLX may not have materialized lazily loaded weights yet,
+        and loads already in progress are counted by their estimates.
+        Caller holds the lock.
+        """
+        loading = sum(self._estimate_bytes(name) for name in self._loading)
+        return max(self.usage_bytes(), self._resident_bytes()) + loading + needed
+
+    def _make_room(self, needed: int) -> bool:
+        """Evicts idle models until `needed` more bytes fit. Caller holds the lock."""
+        if not self.budget_bytes:
+            return True
+        if self._projected_bytes(needed) <= self.budget_bytes:
+            return True
+        while self._evict_one():
+            if self._projected_bytes(needed) <= self.budget_bytes:
+                return True
+        return False
+
+    def pin(self, name: str):
+        """Keeps `name` resident once loaded; pressure eviction skips it."""
+        with self._cond:
+            self._pinned.add(name)
+
+    def _evict_one(self) -> bool:
+        """Drops the least recently used idle, unpinned model. Caller holds the lock."""
+        for name, entry in self._models.items():
+            if entry.refcount == 0 and name not in self._pinned:
+                del self._models[name]
+                del entry
+                self._evictions += 1
+                self._collect()
+                print(f"Evicted model {name} under memory pressure")
+                return True
+        return False
+
+    def _collect(self):
+        gc.collect()
+        clear_accelerator_cache()
+        self._collections += 1
+
+    def relieve_pressure(self):
+        """
+        Called after each request. Collects garbage and releases cached
+        accelerator buffers only when usage is above the pressure threshold,
+        evicting idle models if that is not enough.
+        """
+        if not self.budget_bytes:
+            self.usage_bytes()
+            return
+        threshold = self.budget_bytes * self.pressure_ratio
+        if self.usage_bytes() < threshold:
+            return
+        with self._cond:
+            self._collect()
+            while self.usage_bytes() >= threshold and self._evict_one():
+                pass
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        usage = self.usage_bytes()
+        accelerator = accelerator_memory_bytes()
+        with self._cond:
+            models = [
+                {
+                    "name": entry.name,
+                    "size_mb": round(entry.size_bytes / MB, 1),
+                    "in_use": entry.refcount,
+                    "pinned": entry.name in self._pinned,
+                    "max_concurrency": self._max_concurrency.get(entry.name, 1),
+                    "last_used": entry.last_used,
+                }
+                for entry in self._models.values()
+            ]
+            return {
+                "budget_mb": round(self.budget_bytes / MB, 1),
+                "pressure_ratio": self.pressure_ratio,
+                "usage_mb": round(usage / MB, 1),
+                "rss_mb": round(process_rss_bytes() / MB, 1),
+                "accelerator_active_mb": round(accelerator["active"] / MB, 1),
+                "accelerator_cache_mb": round(accelerator["cache"] / MB, 1),
+                "resident_models_mb": round(self._resident_bytes() / MB, 1),
+                "high_water": {
+                    "rss_mb": round(self._rss_high_water / MB, 1),
+                    "accelerator_mb": round(self._accelerator_high_water / MB, 1),
+                    "resident_models_mb": round(self._model_bytes_high_water / MB, 1),
+                },
+                "models": models,
+                "loading": sorted(self._loading),
+                "collections": self._collections,
+                "evictions": self._evictions,
+                "refused_loads": self._refused_loads,
+            }
+
+
+manager = MemoryManager.from_env()
@@ -0,0 +1,308 @@
+# On-demand profiling of live inference threads
+#
+# A statistical CPU profiler samples the stacks of the threads running TTS/STT
+# work for the next N requests or T seconds, and tracemalloc snapshot diffs
+# attribute allocations to individual requests. Both are off by default; when
+# disabled the only cost is registering the inference thread around each call.
+
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEBUG_ENDPOINTS_ENABLED = os.getenv("DEBUG_ENDPOINTS_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+MAX_PROFILE_SECONDS = 600
+MAX_STACK_DEPTH = 200
+
+# (filename, first line, function name), the key format used by pstats
+FrameKey = Tuple[str, int, str]
+
+# thread ident -> request id, for every thread currently running inference
+_inference_threads: Dict[int, Optional[str]] = {}
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when starting a profile while another one is running."""
+
+
+class CPUProfile:
+    """Stack samples collected by one profiling session."""
+
+    def __init__(self, interval: float, max_requests: Optional[int], max_seconds: Optional[float]):
+        self.interval = interval
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.requests_seen = 0
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self.finished_at is None
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "duration_seconds": round(end - self.started_at, 3),
+            "interval_ms": self.interval * 1000,
+            "max_requests": self.max_requests,
+            "max_seconds": self.max_seconds,
+            "requests_seen": self.requests_seen,
+            "samples": self.sample_count,
+            "unique_stacks": len(self.samples),
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed stack format, loadable by flamegraph tools and speedscope."""
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = ";".join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats_bytes(self) -> bytes:
+        """
+        Converts the samples into the marshalled format read by `pstats.Stats`.
+        Times are estimated as samples x interval; call counts are sample counts.
+        """
+        stats: Dict[FrameKey, list] = {}
+        for stack, count in self.samples.items():
+            seconds = count * self.interval
+            for func in set(stack):
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            stats[stack[-1]][2] += seconds
+            for depth in range(1, len(stack)):
+                caller, callee = stack[depth - 1], stack[depth]
+                own = seconds if depth == len(stack) - 1 else 0.0
+                cc, nc, tt, ct = stats[callee][4].get(caller, (0, 0, 0.0, 0.0))
+                stats[callee][4][caller] = (cc + count, nc + count, tt + own, ct + seconds)
+        return marshal.dumps({func: tuple(entry) for func, entry in stats.items()})
+
+
+def _stack_of(frame) -> Tuple[FrameKey, ...]:
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class _Sampler:
+    """Background thread that samples the inference threads while a profile runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.current: Optional[CPUProfile] = None
+        self.last: Optional[CPUProfile] = None
+
+    def start(self, max_requests: Optional[int] = None, max_seconds: Optional[float] = None) -> CPUProfile:
+        with self._lock:
+            if self.current is not None:
+                raise ProfilerBusy("A CPU profile is already running")
+            if max_requests is None and max_seconds is None:
+                max_seconds = 30.0
+            if max_seconds is not None:
+                max_seconds = min(max_seconds, MAX_PROFILE_SECONDS)
+            profile = CPUProfile(PROFILER_INTERVAL_MS / 1000, max_requests, max_seconds)
+            self.current = profile
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(profile,), name="cpu-profiler", daemon=True)
+            self._thread.start()
+            print(f"CPU profiler started (requests={max_requests}, seconds={max_seconds})")
+            return profile
+
+    def stop(self) -> Optional[CPUProfile]:
+        with self._lock:
+            profile = self.current
+            if profile is None:
+                return self.last
+            self._stop.set()
+            thread = self._thread
+        if thread is not threading.current_thread():
+            thread.join()
+        return profile
+
+    def request_finished(self):
+        profile = self.current
+        if profile is None:
+            return
+        profile.requests_seen += 1
+        if profile.max_requests is not None and profile.requests_seen >= profile.max_requests:
+            self._stop.set()
+
+    def _run(self, profile: CPUProfile):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + profile.max_seconds if profile.max_seconds else None
+        try:
+            while not self._stop.wait(profile.interval):
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                targets = set(_inference_threads)
+                if not targets:
+                    continue
+                for ident, frame in sys._current_frames().items():
+                    if ident in targets and ident != own_ident:
+                        profile.samples[_stack_of(frame)] += 1
+                        profile.sample_count += 1
+        finally:
+            # Even if sampling failed, the profiler must not stay busy forever
+            profile.finished_at = time.time()
+            with self._lock:
+                self.current = None
+                self.last = profile
+        print(f"CPU profiler stopped: {profile.sample_count} samples over {profile.requests_seen} requests")
+
+
+class _AllocationTracker:
+    """tracemalloc snapshot diffs, overall and per inference call."""
+
+    def __init__(self, history: int = 50):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self.per_request: deque = deque(maxlen=history)
+        self.top_n = 10
+
+    @property
+    def active(self) -> bool:
+        return self._baseline is not None
+
+    def start(self, frames: int = 25):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self.per_request.clear()
+            self._baseline = tracemalloc.take_snapshot()
+        print(f"tracemalloc started ({frames} frames)")
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+        print("tracemalloc stopped")
+
+    @staticmethod
+    def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    @staticmethod
+    def _format(stats: List[tracemalloc.StatisticDiff]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "location": str(stat.traceback[0]) if stat.traceback else "?",
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "size_kb": round(stat.size / 1024, 1),
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats
+        ]
+
+    def _snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        """A filtered snapshot, or None if tracking is off (it may be stopped from another thread)."""
+        if not self.active or not tracemalloc.is_tracing():
+            return None
+        try:
+            return self._filtered(tracemalloc.take_snapshot())
+        except RuntimeError:
+            # Stopped between the check and the snapshot
+            return None
+
+    def diff_from_baseline(self, top_n: int = 25) -> List[Dict[str, Any]]:
+        with self._lock:
+            baseline = self._baseline
+        current = self._snapshot()
+        if baseline is None or current is None:
+            return []
+        stats = current.compare_to(self._filtered(baseline), "lineno")
+        return self._format(stats[:top_n])
+
+    @contextmanager
+    def track_request(self, request_id: Optional[str], label: str):
+        before = self._snapshot()
+        if before is None:
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._record(request_id, label, before)
+
+    def _record(self, request_id: Optional[str], label: str, before: tracemalloc.Snapshot):
+        """Stores the allocation diff of one call; never raises into the request."""
+        try:
+            after = self._snapshot()
+            if after is None:
+                return
+            stats = after.compare_to(before, "lineno")
+            self.per_request.append({
+                "request_id": request_id,
+                "function": label,
+                "finished_at": time.time(),
+                "size_diff_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+                # Snapshots are process-wide, so concurrent requests overlap here
+                "top": self._format([stat for stat in stats if stat.size_diff > 0][:self.top_n]),
+            })
+        except Exception as e:
+            print(f"Warning: Could not record allocations for {request_id}: {e}")
+
+
+sampler = _Sampler()
+allocations = _AllocationTracker()
+
+
+@contextmanager
+def inference_thread(request_id: Optional[str], label: str):
+    """Marks the calling thread as running inference for the profilers."""
+    ident = threading.get_ident()
+    _inference_threads[ident] = request_id
+    try:
+        with allocations.track_request(request_id, label):
+            yield
+    finally:
+        _inference_threads.pop(ident, None)
+        sampler.request_finished()
+
+
+def profile_status() -> Dict[str, Any]:
+    current = sampler.current
+    last = sampler.last
+    return {
+        "current": current.summary() if current else None,
+        "last": last.summary() if last else None,
+        "tracemalloc": {
+            "active": allocations.active,
+            "tracked_requests": len(allocations.per_request),
+        },
+    }
+
+
+def export_profile(profile: CPUProfile, fmt: str) -> Tuple[bytes, str, str]:
+    """Returns (content, media type, file name) for a finished profile."""
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(profile.started_at))
+    if fmt == "pstats":
+        return profile.pstats_bytes(), "application/octet-stream", f"profile-{stamp}.pstats"
+    return profile.collapsed().encode("utf-8"), "text/plain", f"profile-{stamp}.collapsed.txt"
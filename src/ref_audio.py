@@ -0,0 +1,175 @@
+# Reference-audio preprocessing for voice cloning
+#
+# Uploaded references come in any length, sample rate and channel count, often
+# with leading/trailing silence. Conditioning cost in the clone model grows
+# with the reference length, so before cloning the upload is decoded once,
+# downmixed, trimmed to its speech by frame energy, capped at a pause near
+# REF_AUDIO_MAX_SECONDS, resampled to the model rate and loudness-normalized.
+# Everything is vectorized NumPy; trimming and capping happen at the source
+# rate so the resampler only sees the audio that is kept.
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from . import audio_io
+from . import coalescing
+
+load_dotenv()
+
+REF_AUDIO_MAX_SECONDS = float(os.getenv("REF_AUDIO_MAX_SECONDS", "10"))
+# Frames quieter than this (dB relative to the loudest frame) count as silence
+REF_AUDIO_SILENCE_DB = float(os.getenv("REF_AUDIO_SILENCE_DB", "-40"))
+# RMS level of the speech frames after normalization
+REF_AUDIO_TARGET_DBFS = float(os.getenv("REF_AUDIO_TARGET_DBFS", "-20"))
+REF_AUDIO_CACHE_SIZE = int(os.getenv("REF_AUDIO_CACHE_SIZE", "16"))
+
+FRAME_SECONDS = 0.02
+# Silence kept around the speech so onsets and decays are not clipped
+PAD_SECONDS = 0.1
+# How far back from the cap to look for a pause to cut at
+CUT_SEARCH_SECONDS = 2.0
+FADE_SECONDS = 0.01
+PEAK_LIMIT = 10 ** (-1 / 20)  # -1 dBFS
+
+
+class InvalidReferenceAudio(ValueError):
+    """The uploaded reference cannot be decoded or contains no speech."""
+
+
+class PreparedReference:
+    """A preprocessed reference clip at the clone model's sample rate."""
+
+    def __init__(self, audio: np.ndarray, sample_rate: int, source_seconds: float, truncated: bool):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.source_seconds = source_seconds
+        # True if the cap dropped speech, so a transcript of the upload no longer matches
+        self.truncated = truncated
+        # Filled in once the clip has been auto-transcribed, and reused from the cache
+        self.transcript: Optional[str] = None
+
+    @property
+    def seconds(self) -> float:
+        return len(self.audio) / self.sample_rate
+
+    def at_rate(self, sample_rate: int) -> np.ndarray:
+        return audio_io.resample(self.audio, self.sample_rate, sample_rate)
+
+
+def _frame_rms_db(audio: np.ndarray, frame: int) -> np.ndarray:
+    """RMS level of consecutive `frame`-sample frames, in dBFS."""
+    n_frames = max(1, -(-len(audio) // frame))
+    padded = np.zeros(n_frames * frame, dtype=np.float32)
+    padded[:len(audio)] = audio
+    rms = np.sqrt(np.mean(np.square(padded.reshape(n_frames, frame)), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def preprocess(
+    audio: np.ndarray,
+    sample_rate: int,
+    target_rate: int,
+    max_seconds: float = REF_AUDIO_MAX_SECONDS,
+) -> PreparedReference:
+    """
+    Turns decoded PCM ([samples] or [samples, channels]) into a mono clip at
+    `target_rate`: silence trimmed, capped to `max_seconds` at the last pause
+    before the cap (or the quietest frame if there is none), and scaled to REF_AUDIO_TARGET_DBFS without clipping.
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    source_seconds = len(audio) / sample_rate
+    if len(audio) == 0:
+        raise InvalidReferenceAudio("Reference audio is empty")
+
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    levels = _frame_rms_db(audio, frame)
+    voiced = levels > levels.max() + REF_AUDIO_SILENCE_DB
+    if levels.max() <= -100 or not voiced.any():
+        raise InvalidReferenceAudio("Reference audio contains no speech")
+
+    # Trim leading/trailing silence
+    pad = int(PAD_SECONDS * sample_rate)
+    voiced_frames = np.flatnonzero(voiced)
+    start = max(0, voiced_frames[0] * frame - pad)
+    end = min(len(audio), (voiced_frames[-1] + 1) * frame + pad)
+
+    # Cap the length, cutting at the last pause in the last few seconds so
+    # as much speech as possible is kept, or else at the quietest frame
+    truncated = False
+    max_samples = int(max_seconds * sample_rate)
+    if max_seconds > 0 and end - start > max_samples:
+        first = (start + max(0, max_samples - int(CUT_SEARCH_SECONDS * sample_rate))) // frame
+        last = max(first + 1, (start + max_samples) // frame)
+        pauses = np.flatnonzero(~voiced[first:last])
+        cut = first + int(pauses[-1] if len(pauses) else np.argmin(levels[first:last]))
+        end = min((cut + 1) * frame, start + max_samples)
+        truncated = bool(voiced[cut + 1:].any())
+    clip = audio[start:end]
+
+    # Fade out the cut so it does not click if it did not land on silence
+    fade = min(len(clip), int(FADE_SECONDS * sample_rate))
+    if truncated and fade:
+        clip = clip.copy()
+        clip[-fade:] *= np.linspace(1.0, 0.0, fade, dtype=np.float32)
+
+    clip = audio_io.resample(clip, sample_rate, target_rate)
+
+    # Normalize the loudness of the speech frames, limited by the peak
+    target_frame = max(1, int(target_rate * FRAME_SECONDS))
+    clip_levels = _frame_rms_db(clip, target_frame)
+    speech_levels = clip_levels[clip_levels > clip_levels.max() + REF_AUDIO_SILENCE_DB]
+    speech_rms = np.sqrt(np.mean(np.square(10 ** (speech_levels / 20))))
+    gain = 10 ** (REF_AUDIO_TARGET_DBFS / 20) / max(speech_rms, 1e-10)
+    peak = float(np.max(np.abs(clip)))
+    if peak * gain > PEAK_LIMIT:
+        gain = PEAK_LIMIT / peak
+    clip = (clip * gain).astype(np.float32)
+
+    return PreparedReference(clip, target_rate, source_seconds, truncated)
+
+
+def _source_summary(audio: np.ndarray, sample_rate: int) -> str:
+    channels = audio.shape[1] if audio.ndim > 1 else 1
+    return f"{len(audio) / sample_rate:.1f}s {channels}ch @ {sample_rate} Hz"
+
+
+_cache: "OrderedDict[tuple, PreparedReference]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def prepare_reference(data: bytes, target_rate: int) -> PreparedReference:
+    """
+    Decodes and preprocesses an uploaded reference. The most recently used
+    references are cached by content, so repeat uploads of the same voice skip
+    decoding, preprocessing and auto-transcription.
+    """
+    key = (coalescing.content_hash(data), target_rate, REF_AUDIO_MAX_SECONDS)
+    with _cache_lock:
+        reference = _cache.get(key)
+        if reference is not None:
+            _cache.move_to_end(key)
+            return reference
+
+    try:
+        audio, sample_rate = audio_io.decode_audio(data)
+    except Exception as e:
+        raise InvalidReferenceAudio(f"Could not decode reference audio: {e}") from e
+    reference = preprocess(audio, sample_rate, target_rate)
+    print(
+        f"Reference audio: {_source_summary(audio, sample_rate)} -> "
+        f"{reference.seconds:.1f}s mono @ {target_rate} Hz" + (" (truncated)" if reference.truncated else "")
+    )
+
+    if REF_AUDIO_CACHE_SIZE > 0:
+        with _cache_lock:
+            _cache[key] = reference
+            while len(_cache) > REF_AUDIO_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return reference
@@ -0,0 +1,120 @@
+# Cache of 1.0x speech renders
+#
+# Speech is always generated at 1.0x and stored here as PCM; every speed is
+# then derived by time-stretching (time_stretch.py), so asking for the same
+# text at another speed never reaches the model. Entries are evicted least
+# recently used first once RENDER_CACHE_MB is exceeded. Concurrent requests
+# for the same render (e.g. 0.75x and 1.25x of one text) share one generation.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from . import cancellation
+from . import tracing
+
+load_dotenv()
+
+RENDER_CACHE_MB = float(os.getenv("RENDER_CACHE_MB", "256"))
+
+# How often a request waiting on another request's render checks its own token
+_WAIT_POLL_SECONDS = 0.1
+
+
+class RenderCache:
+    """LRU of (PCM, sample rate) renders with a byte budget and one render per key at a time."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[np.ndarray, int]]" = OrderedDict()
+        self._pending: Dict[str, threading.Event] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._shared = 0
+        self._evictions = 0
+
+    def get_or_render(
+        self,
+        key: str,
+        render: Callable[[], tuple[np.ndarray, int]],
+        cancel_token: Optional[cancellation.CancellationToken] = None,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Returns the cached render for `key`, or calls `render()` to produce it.
+        If another thread is already rendering `key`, waits for its result
+        instead; if that render fails, one of the waiters renders it itself.
+        """
+        while True:
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    now = time.perf_counter()
+                    tracing.record_span("render_cache_hit", now, now)
+                    return cached
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    self._misses += 1
+                    break
+                self._shared += 1
+
+            with tracing.span("render_wait"):
+                while not event.wait(_WAIT_POLL_SECONDS):
+                    cancellation.check(cancel_token)
+
+        try:
+            audio, sample_rate = render()
+            audio = np.asarray(audio, dtype=np.float32)
+            self._store(key, audio, sample_rate)
+            return audio, sample_rate
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            event.set()
+
+    def _store(self, key: str, audio: np.ndarray, sample_rate: int):
+        if audio.nbytes > self.budget_bytes:
+            return
+        # Cached arrays are shared between requests
+        audio.flags.writeable = False
+        with self._lock:
+            self._entries[key] = (audio, sample_rate)
+            self._bytes += audio.nbytes
+            while self._bytes > self.budget_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._evictions += 1
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 1),
+                "size_mb": round(self._bytes / (1024 * 1024), 1),
+                "entries": len(self._entries),
+                "rendering": len(self._pending),
+                "hits": self._hits,
+                "misses": self._misses,
+                "shared_renders": self._shared,
+                "evictions": self._evictions,
+            }
+
+
+cache = RenderCache(int(RENDER_CACHE_MB * 1024 * 1024))
@@ -0,0 +1,214 @@
+# Shortest-expected-job-first scheduling of inference jobs
+#
+# Inference runs in at most INFERENCE_SLOTS jobs at a time. When more jobs are
+# waiting, the one with the smallest expected run time (from cost_model) goes
+# first, so a short request is not stuck behind a long-form job. To prevent
+# starvation, a job's priority improves by SCHEDULER_AGING seconds for every
+# second it waits. With linear aging the priority is simply
+# expected + aging * enqueue_time, which does not change while a job waits.
+# Each job gets a predicted start and completion time, reported in response
+# headers and by the queue status API. A job predicted to start after its
+# request's deadline is rejected at admission instead of queueing in vain, but
+# only when every job ahead of it has a measured rate rather than the prior.
+# Long-form jobs take a slot per chunk, so short jobs run between chunks.
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from . import tracing
+from .cost_model import estimator
+
+load_dotenv()
+
+INFERENCE_SLOTS = int(os.getenv("INFERENCE_SLOTS", "2"))
+SCHEDULER_AGING = float(os.getenv("SCHEDULER_AGING", "1.0"))
+
+
+class SchedulerOverloaded(Exception):
+    """Raised at admission when a job is predicted to start after its deadline."""
+
+
+class _Job:
+    __slots__ = (
+        "request_id", "label", "model", "units", "unit", "expected",
+        "enqueued_at", "started_at", "priority", "future",
+    )
+
+    def __init__(self, request_id: Optional[str], label: str, model: str, units: float, unit: str, expected: float):
+        self.request_id = request_id
+        self.label = label
+        self.model = model
+        self.units = units
+        self.unit = unit
+        self.expected = expected
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.priority = 0.0
+        self.future: Optional[asyncio.Future] = None
+
+
+class InferenceScheduler:
+    """Admits inference jobs to a fixed number of slots in shortest-expected-job-first order."""
+
+    def __init__(self, slots: int = INFERENCE_SLOTS, aging: float = SCHEDULER_AGING):
+        self.slots = max(1, slots)
+        self.aging = aging
+        self._running: List[_Job] = []
+        self._queue: List[tuple] = []
+        self._sequence = itertools.count()
+        self.finished = 0
+        self.abandoned = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, label: str, model: str, units: float, unit: str, deadline: Optional[float] = None):
+        """
+        Holds an inference slot for a job of `units` `unit`s on `model`.
+        Time spent queued is traced as "schedule_wait", and the predictions
+        made at admission are added to the response headers. If the job would
+        have to queue past `deadline` (time.monotonic()) according to measured
+        rates, SchedulerOverloaded is raised instead.
+        """
+        job = self._job(label, model, units, unit)
+        await self._admit(job, deadline)
+        try:
+            yield job
+        finally:
+            self.finished += 1
+            self._release(job)
+
+    def _job(self, label: str, model: str, units: float, unit: str) -> _Job:
+        job = _Job(tracing.current_request_id(), label, model, units, unit, estimator.estimate(model, units, unit))
+        job.priority = job.expected + self.aging * job.enqueued_at
+        return job
+
+    async def _admit(self, job: _Job, deadline: Optional[float] = None):
+        """Starts `job` or queues it and waits until a slot is handed to it."""
+        if len(self._running) < self.slots and not self._queue:
+            self._start(job)
+            self._annotate(job)
+            return
+
+        job.future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (job.priority, next(self._sequence), job))
+        if deadline is not None and self._measured_ahead(job):
+            start, _ = self._predictions()[id(job)]
+            if time.monotonic() + start > deadline:
+                self._remove(job)
+                self.rejected += 1
+                raise SchedulerOverloaded(
+                    f"Server busy: predicted to start in {start:.0f}s, after the request's deadline"
+                )
+        self._annotate(job)
+
+        start = time.perf_counter()
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job.started_at is None:
+                self._remove(job)
+            else:
+                # Granted a slot just as the wait was cancelled
+                self._release(job)
+            self.abandoned += 1
+            raise
+        tracing.record_span("schedule_wait", start, time.perf_counter(), expected=round(job.expected, 2))
+
+    def _measured_ahead(self, job: _Job) -> bool:
+        """Whether the predicted start of queued `job` rests on observed rates only, not priors."""
+        queued = [entry[2] for entry in sorted(self._queue)]
+        ahead = self._running + queued[:queued.index(job)]
+        return all(estimator.observed(other.model, other.unit) for other in ahead)
+
+    def _remove(self, job: _Job):
+        self._queue = [entry for entry in self._queue if entry[2] is not job]
+        heapq.heapify(self._queue)
+
+    def _start(self, job: _Job):
+        job.started_at = time.monotonic()
+        self._running.append(job)
+
+    def _release(self, job: _Job):
+        """Frees `job`'s slot and starts the next queued jobs."""
+        self._running.remove(job)
+        while self._queue and len(self._running) < self.slots:
+            _, _, next_job = heapq.heappop(self._queue)
+            if next_job.future.cancelled():
+                # Its waiter was cancelled and will not run
+                continue
+            self._start(next_job)
+            next_job.future.set_result(None)
+
+    def _predictions(self) -> Dict[int, tuple[float, float]]:
+        """Predicted (start, completion) in seconds from now, for every job, by id()."""
+        now = time.monotonic()
+        predictions = {}
+        free_at = []
+        for job in self._running:
+            remaining = max(0.0, job.expected - (now - job.started_at))
+            predictions[id(job)] = (0.0, remaining)
+            free_at.append(remaining)
+        free_at.extend([0.0] * (self.slots - len(free_at)))
+        heapq.heapify(free_at)
+        for _, _, job in sorted(self._queue):
+            start = heapq.heappop(free_at)
+            predictions[id(job)] = (start, start + job.expected)
+            heapq.heappush(free_at, start + job.expected)
+        return predictions
+
+    def _annotate(self, job: _Job):
+        trace = tracing.current_trace()
+        # A job scheduled in steps reports its first admission
+        if trace is None or "X-Queue-Position" in trace.headers:
+            return
+        start, finish = self._predictions()[id(job)]
+        trace.set_header("X-Queue-Position", str(self._position(job)))
+        trace.set_header("X-Estimated-Duration", f"{job.expected:.2f}")
+        trace.set_header("X-Estimated-Queue-Wait", f"{start:.2f}")
+        trace.set_header("X-Estimated-Completion", f"{time.time() + finish:.3f}")
+
+    def _position(self, job: _Job) -> int:
+        """0 if the job is running, otherwise its 1-based place in the queue."""
+        if job.started_at is not None:
+            return 0
+        return [entry[2] for entry in sorted(self._queue)].index(job) + 1
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        wall = time.time()
+        predictions = self._predictions()
+
+        def describe(job: _Job) -> Dict[str, Any]:
+            start, finish = predictions[id(job)]
+            return {
+                "request_id": job.request_id,
+                "function": job.label,
+                "model": job.model,
+                job.unit: round(job.units, 2),
+                "expected_seconds": round(job.expected, 2),
+                "waited_seconds": round((job.started_at or now) - job.enqueued_at, 2),
+                "running_seconds": round(now - job.started_at, 2) if job.started_at else None,
+                "estimated_start_in": round(start, 2),
+                "estimated_completion": round(wall + finish, 3),
+            }
+
+        return {
+            "slots": self.slots,
+            "aging": self.aging,
+            "running": [describe(job) for job in self._running],
+            "queued": [describe(job) for _, _, job in sorted(self._queue)],
+            "finished": self.finished,
+            "abandoned": self.abandoned,
+            "rejected": self.rejected,
+            "cost_model": estimator.stats(),
+        }
+
+
+scheduler = InferenceScheduler()
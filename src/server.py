@@ -0,0 +1,36 @@
+# Production launcher
+#
+# `start.py` runs the development server with auto-reload. This launcher runs
+# uvicorn without the file watcher, configured from the environment, and does
+# not import the application itself, so workers are the only processes that
+# load it.
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def serve():
+    import uvicorn
+
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "8000"))
+    # Each worker is a separate process with its own resident models; the default
+    # memory budget (memory_manager) is divided between them
+    workers = int(os.getenv("WORKERS", "1"))
+    loop = os.getenv("UVICORN_LOOP", "auto")  # auto, asyncio or uvloop
+    http = os.getenv("UVICORN_HTTP", "auto")  # auto, h11 or httptools
+
+    print(f"Starting server on {host}:{port} ({workers} worker(s), loop={loop}, http={http})")
+    uvicorn.run(
+        "src.main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        reload=False,
+        log_level=os.getenv("LOG_LEVEL", "info"),
+    )
@@ -3,36 +3,48 @@ import os
 import io
 import tempfile
 import asyncio
-import gc  # 新增：用于手动回收内存
+from contextlib import nullcontext
 from typing import Optional, BinaryIO, Dict, Any, Union
 
-from mlx_audio.stt.models.whisper import Model
+from . import cancellation
+from . import cost_model
+from . import tracing
+from .memory_manager import manager as memory_manager
+
+DEFAULT_STT_MODEL = "mlx-community/whisper-large-v3-turbo"
+
+
+def load_stt_model(model_name: str):
+    """Loads a Whisper model; used by the memory manager when the model is not resident."""
+    from mlx_audio.stt.models.whisper import Model
+    return Model.from_pretrained(model_name)
+
 
 def transcribe_audio_sync(
     audio_file: Union[str, BinaryIO, bytes],
-    model_name: str = "mlx-community/whisper-large-v3-turbo",
+    model_name: str = DEFAULT_STT_MODEL,
     language: Optional[str] = None,
     prompt: Optional[str] = None,
     temperature: float = 0.0,
+    cancel_token: Optional[cancellation.CancellationToken] = None,
+    audio_seconds: Optional[float] = None,
 ) -> Dict[str, Any]:
     """
-    每次请求时加载模型，识别后立即释放内存。
+    使用常驻 Whisper 模型识别，内存压力由 memory_manager 统一管理。
     Args:
         audio_file: File path, file-like object, or bytes containing audio data
         model_name: Name of the Whisper model to use
         language: Optional language code for transcription
         prompt: Optional prompt to guide transcription
         temperature: Sampling temperature (0.0 means deterministic)
+        cancel_token: Optional token; checked before the (uninterruptible) decode starts
+        audio_seconds: Length of the audio as estimated by the caller; the decode
+            time per second of audio feeds the scheduler's cost model
     Returns:
         Dictionary with transcription result
     """
     print(f"Transcribing audio using model: {model_name}")
 
-    # ----------------------
-    # 每次请求时加载模型
-    # ----------------------
-    model = Model.from_pretrained(model_name)
-
     temp_file = None
     try:
         if isinstance(audio_file, str):
@@ -55,13 +67,26 @@ def transcribe_audio_sync(
         if temperature != 0.0:
             options["temperature"] = temperature
 
-        result = model.generate(audio=audio_path, **options)
+        # ----------------------
+        # 获取常驻模型（未加载时按内存预算加载）
+        # ----------------------
+        measure = (
+            cost_model.measure(model_name, audio_seconds, cost_model.AUDIO_SECONDS)
+            if audio_seconds else nullcontext()
+        )
+
+        cancellation.check(cancel_token)
+        with memory_manager.use_model(model_name, load_stt_model) as model:
+            # The whisper decode cannot be interrupted, so skip it if the
+            # result is no longer wanted (e.g. waited too long for the model)
+            cancellation.check(cancel_token)
+            with tracing.span("transcribe", model=model_name), measure:
+                result = model.generate(audio=audio_path, **options)
 
         # ----------------------
-        # 推理后立即释放模型内存
+        # 仅在内存压力较大时回收内存 / 驱逐空闲模型
         # ----------------------
-        del model  # 删除模型对象
-        gc.collect()  # 强制回收内存
+        memory_manager.relieve_pressure()
 
         response = {
             "text": result
@@ -0,0 +1,145 @@
+# STT model pool: routes transcription requests to whisper models
+#
+# The `model` form field selects a route ("whisper-large-v3-turbo",
+# "whisper-small", ...), a route's full repo name, or "auto". Auto routing
+# probes the upload's duration from its header and sends short clips to the
+# small (pinned, so it stays resident) model and long recordings to the large
+# one. Each route has its own concurrency limit, which also bounds how many
+# threads the memory manager lets into the shared model. Routes can be overridden
+# with a JSON file named by STT_ROUTES_FILE, using the same schema as
+# DEFAULT_STT_ROUTES.
+
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from . import audio_io
+from . import tracing
+from .memory_manager import manager as memory_manager
+
+load_dotenv()
+
+DEFAULT_STT_ROUTES: Dict[str, Dict[str, Any]] = {
+    "whisper-large-v3-turbo": {
+        "model": "mlx-community/whisper-large-v3-turbo",
+        "max_concurrency": 1,
+    },
+    "whisper-small": {
+        "model": "mlx-community/whisper-small-mlx",
+        "max_concurrency": 1,
+        "pinned": True,
+    },
+}
+
+AUTO_ROUTE = "auto"
+# OpenAI clients send "whisper-1"
+STT_ALIASES = {"whisper-1": AUTO_ROUTE}
+
+# Missing or unknown models use this route
+STT_DEFAULT_ROUTE = os.getenv("STT_DEFAULT_ROUTE", AUTO_ROUTE)
+STT_AUTO_SHORT_ROUTE = os.getenv("STT_AUTO_SHORT_ROUTE", "whisper-small")
+STT_AUTO_LONG_ROUTE = os.getenv("STT_AUTO_LONG_ROUTE", "whisper-large-v3-turbo")
+# Clips up to this long go to the short route; clips of unknown length go to the long one
+STT_AUTO_SHORT_SECONDS = float(os.getenv("STT_AUTO_SHORT_SECONDS", "30"))
+
+
+def load_stt_routes() -> Dict[str, Dict[str, Any]]:
+    routes = {name: dict(route) for name, route in DEFAULT_STT_ROUTES.items()}
+    routes_file = os.getenv("STT_ROUTES_FILE")
+    if routes_file:
+        with open(routes_file, encoding="utf-8") as f:
+            routes.update(json.load(f))
+    return routes
+
+
+STT_ROUTES = load_stt_routes()
+_routes_by_model = {route["model"]: name for name, route in STT_ROUTES.items()}
+
+for _route in STT_ROUTES.values():
+    memory_manager.set_max_concurrency(_route["model"], _route.get("max_concurrency", 1))
+    if _route.get("pinned"):
+        memory_manager.pin(_route["model"])
+
+
+def route_name(model: Optional[str]) -> str:
+    """Maps a request model (route, alias, repo name or "auto") to a route name or "auto"."""
+    model = STT_ALIASES.get(model, model)
+    if model in STT_ROUTES or model == AUTO_ROUTE:
+        return model
+    if model in _routes_by_model:
+        return _routes_by_model[model]
+    # Arbitrary repo names are not accepted, so clients cannot trigger downloads
+    if model:
+        print(f"Warning: Unknown STT model '{model}'; using '{STT_DEFAULT_ROUTE}'")
+    return STT_DEFAULT_ROUTE
+
+
+def resolve(model: Optional[str], audio: bytes) -> tuple[str, Optional[float]]:
+    """
+    Returns the route serving `model` for this upload, and the duration probed
+    from its header (only probed for auto routing).
+    """
+    route = route_name(model)
+    if route != AUTO_ROUTE:
+        return route, None
+    with tracing.span("probe_duration"):
+        duration = audio_io.probe_duration(audio)
+    if duration is not None and duration <= STT_AUTO_SHORT_SECONDS:
+        return STT_AUTO_SHORT_ROUTE, duration
+    return STT_AUTO_LONG_ROUTE, duration
+
+
+def model_for(route: str) -> str:
+    return STT_ROUTES[route]["model"]
+
+
+_slots: Dict[str, asyncio.Semaphore] = {}
+_waiting: Dict[str, int] = {}
+_in_use: Dict[str, int] = {}
+
+
+@asynccontextmanager
+async def slot(route: str):
+    """Holds one of `route`'s concurrency slots; waiting time is traced as "stt_slot_wait"."""
+    semaphore = _slots.get(route)
+    if semaphore is None:
+        semaphore = _slots[route] = asyncio.Semaphore(STT_ROUTES[route].get("max_concurrency", 1))
+    start = time.perf_counter()
+    _waiting[route] = _waiting.get(route, 0) + 1
+    try:
+        await semaphore.acquire()
+    finally:
+        _waiting[route] -= 1
+    tracing.record_span("stt_slot_wait", start, time.perf_counter(), model=model_for(route))
+    _in_use[route] = _in_use.get(route, 0) + 1
+    try:
+        yield
+    finally:
+        _in_use[route] -= 1
+        semaphore.release()
+
+
+def stats() -> Dict[str, Any]:
+    routes = {}
+    for name, route in STT_ROUTES.items():
+        routes[name] = {
+            "model": route["model"],
+            "max_concurrency": route.get("max_concurrency", 1),
+            "pinned": bool(route.get("pinned")),
+            "in_use": _in_use.get(name, 0),
+            "waiting": _waiting.get(name, 0),
+        }
+    return {
+        "default_route": STT_DEFAULT_ROUTE,
+        "auto": {
+            "short_route": STT_AUTO_SHORT_ROUTE,
+            "long_route": STT_AUTO_LONG_ROUTE,
+            "short_seconds": STT_AUTO_SHORT_SECONDS,
+        },
+        "routes": routes,
+    }
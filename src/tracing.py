@@ -0,0 +1,237 @@
+# Per-request stage tracing
+#
+# Each HTTP request gets a Trace holding timed spans (upload read, queue wait,
+# model acquire, generation, ...). The active trace travels in a context
+# variable, which asyncio copies into tasks and `asyncio.to_thread` workers, so
+# the TTS/STT logic can record spans without having the trace passed in.
+# Finished traces are returned in a Server-Timing header and appended to a
+# size-capped JSON-lines log by a background thread, so the event loop never
+# waits on disk I/O.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set TRACE_LOG_FILE to an empty string to disable the trace log
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "traces.jsonl")
+# The log is rotated at this size, keeping TRACE_LOG_BACKUPS old files
+TRACE_LOG_MAX_MB = float(os.getenv("TRACE_LOG_MAX_MB", "100"))
+TRACE_LOG_BACKUPS = int(os.getenv("TRACE_LOG_BACKUPS", "3"))
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_log_lock = threading.Lock()
+_trace_logger: Optional[logging.Logger] = None
+
+
+class Trace:
+    """Timed spans for a single request."""
+
+    def __init__(self, request_id: Optional[str] = None, method: str = "", path: str = ""):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+        self._spans: List[Dict[str, Any]] = []
+        # Extra response headers set while handling the request (e.g. ETAs)
+        self.headers: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, end: float, **attrs: Any):
+        """Records a span from `time.perf_counter()` timestamps."""
+        span = {
+            "name": name,
+            "start_ms": round((start - self._start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+            "thread": threading.current_thread().name,
+        }
+        span.update({k: v for k, v in attrs.items() if v is not None})
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter(), **attrs)
+
+    def set_header(self, name: str, value: str):
+        """Adds a header to the response, if it has not started yet."""
+        self.headers[name] = value
+
+    def finish(self, status: Optional[int] = None):
+        self.status = status
+        self._end = time.perf_counter()
+
+    @property
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+
+    def server_timing(self) -> str:
+        """
+        Formats the spans recorded so far as a Server-Timing header value.
+        Repeated spans (e.g. one per chunk) are summed into one metric.
+        """
+        totals: Dict[str, float] = {}
+        counts: Dict[str, int] = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_ms"]
+            counts[span["name"]] = counts.get(span["name"], 0) + 1
+        metrics = []
+        for name, duration in totals.items():
+            metric = f"{name};dur={duration:.1f}"
+            if counts[name] > 1:
+                metric += f';desc="{counts[name]}x"'
+            metrics.append(metric)
+        elapsed = ((self._end or time.perf_counter()) - self._start) * 1000
+        metrics.append(f"total;dur={elapsed:.1f}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self._end or time.perf_counter()
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round((end - self._start) * 1000, 3),
+            "spans": self.spans,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+def activate(trace: Trace):
+    """Makes `trace` the current trace; returns a token for `deactivate`."""
+    return _current_trace.set(trace)
+
+
+def deactivate(token):
+    _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """Times the enclosed block as a span of the current trace (no-op without one)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **attrs):
+        yield
+
+
+def record_span(name: str, start: float, end: float, **attrs: Any):
+    """Records a span with explicit `time.perf_counter()` bounds on the current trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, end, **attrs)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that traces each HTTP request. Stage spans recorded before
+    the response starts go into the Server-Timing header; the full trace,
+    including the response write, goes to the trace log.
+
+    Implemented as plain ASGI (not BaseHTTPMiddleware) so endpoints can still
+    detect client disconnects through `Request.is_disconnected()`.
+    """
+
+    def __init__(self, app, exclude_paths: Iterable[str] = ()):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.datastructures import Headers, MutableHeaders
+
+        trace = Trace(Headers(scope=scope).get("x-request-id"), scope.get("method", ""), scope.get("path", ""))
+        token = activate(trace)
+        write_start = None
+
+        async def send_with_timing(message):
+            nonlocal write_start
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = MutableHeaders(scope=message)
+                for name, value in trace.headers.items():
+                    headers[name] = value
+                headers["X-Request-ID"] = trace.request_id
+                headers["Server-Timing"] = trace.server_timing()
+                write_start = time.perf_counter()
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                trace.add_span("response_write", write_start or time.perf_counter(), time.perf_counter())
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            deactivate(token)
+            trace.finish(trace.status or 500)
+            write_trace(trace)
+
+
+def _get_trace_logger() -> logging.Logger:
+    """
+    The trace logger, created on first use: records are queued and written
+    to a RotatingFileHandler by a QueueListener thread.
+    """
+    global _trace_logger
+    with _log_lock:
+        if _trace_logger is None:
+            file_handler = logging.handlers.RotatingFileHandler(
+                TRACE_LOG_FILE,
+                maxBytes=int(TRACE_LOG_MAX_MB * 1024 * 1024),
+                backupCount=TRACE_LOG_BACKUPS,
+                encoding="utf-8",
+                delay=True,
+            )
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            records: queue.Queue = queue.Queue()
+            listener = logging.handlers.QueueListener(records, file_handler)
+            listener.start()
+            atexit.register(listener.stop)
+
+            logger = logging.getLogger("mac_dia_server.traces")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(logging.handlers.QueueHandler(records))
+            _trace_logger = logger
+        return _trace_logger
+
+
+def write_trace(trace: Trace):
+    """Queues the trace to be appended as one JSON line to TRACE_LOG_FILE."""
+    if not TRACE_LOG_FILE:
+        return
+    _get_trace_logger().info(json.dumps(trace.to_dict(), separators=(",", ":")))
@@ -0,0 +1,223 @@
+# Pluggable TTS engines and the routing table that maps request models to them
+#
+# `TTSRequest.model` selects a route ("tts-1", "tts-1-hd", ...). Each route
+# names an engine, the backend model it runs, and how OpenAI voice names map
+# to the engine's own voices. Routes can be overridden with a JSON file named
+# by TTS_ROUTES_FILE, using the same schema as DEFAULT_ROUTES.
+
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from . import cancellation
+from . import cost_model
+from . import tracing
+from .memory_manager import manager as memory_manager
+
+load_dotenv()
+
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    # Small, fast model for low-latency requests; Kokoro's language (lang_code)
+    # comes from each voice's prefix, e.g. "a" for af_alloy, "b" for bm_fable.
+    # It yields a segment per sentence, each one a cancellation checkpoint.
+    "tts-1": {
+        "engine": "mlx",
+        "model": "mlx-community/Kokoro-82M-bf16",
+        "split_pattern": r"(?<=[.!?。！？])\s+",
+        "voices": {
+            "alloy": "af_alloy",
+            "echo": "am_echo",
+            "fable": "bm_fable",
+            "onyx": "am_onyx",
+            "nova": "af_nova",
+            "shimmer": "af_bella",
+        },
+    },
+    # Dia picks speakers from [S1]/[S2] tags in the text rather than a voice name.
+    # It generates the whole input in one pass, so it cannot stop part-way.
+    "tts-1-hd": {
+        "engine": "mlx",
+        "model": "mlx-community/Dia-1.6B-fp16",
+        "voices": {},
+    },
+    # No model at all; produces tones so the API can be exercised on any host
+    "stub": {
+        "engine": "stub",
+    },
+}
+
+# Models not in the routing table fall back to this route
+DEFAULT_ROUTE = os.getenv("TTS_DEFAULT_ROUTE", "tts-1-hd")
+
+
+# Kokoro voice names: language letter, gender letter, underscore ("bm_fable")
+_KOKORO_VOICE = re.compile(r"^([a-z])[fm]_")
+
+
+def load_tts_model(model_name: str):
+    """Loads an mlx-audio TTS model; used by the memory manager when the model is not resident."""
+    from mlx_audio.tts.utils import load_model
+    return load_model(model_path=model_name)
+
+
+class TTSEngine:
+    """Base class for TTS backends. Engines return float32 PCM and its sample rate."""
+
+    def __init__(self, route: str, voices: Optional[Dict[str, str]] = None):
+        self.route = route
+        self.voices = voices or {}
+
+    @property
+    def name(self) -> str:
+        return self.route
+
+    def resolve_voice(self, voice: Optional[str]) -> Optional[str]:
+        """Maps an OpenAI voice name to this engine's voice (None if the engine has no voices)."""
+        if not self.voices:
+            return None
+        return self.voices.get(voice, voice)
+
+    def synthesize(
+        self,
+        text: str,
+        voice: Optional[str],
+        speed: float = 1.0,
+        cancel_token: Optional[cancellation.CancellationToken] = None,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Returns float32 PCM and its sample rate. Engines check `cancel_token`
+        between generation steps and raise OperationCancelled once it fires.
+        """
+        raise NotImplementedError
+
+
+class MlxAudioEngine(TTSEngine):
+    """Runs an mlx-audio model, kept resident by the memory manager."""
+
+    def __init__(
+        self,
+        route: str,
+        model: str,
+        lang_code: Optional[str] = None,
+        split_pattern: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(route, **kwargs)
+        self.model_name = model
+        self.lang_code = lang_code
+        # Passed to models that split their input (Kokoro); each piece is a
+        # segment, and the cancellation token is checked between segments
+        self.split_pattern = split_pattern
+
+    @property
+    def name(self) -> str:
+        return f"{self.route} ({self.model_name})"
+
+    def lang_code_for(self, engine_voice: Optional[str]) -> Optional[str]:
+        """The route's lang_code if set, otherwise the language prefix of a Kokoro voice."""
+        if self.lang_code:
+            return self.lang_code
+        match = _KOKORO_VOICE.match(engine_voice or "")
+        return match.group(1) if match else None
+
+    def synthesize(
+        self,
+        text: str,
+        voice: Optional[str],
+        speed: float = 1.0,
+        cancel_token: Optional[cancellation.CancellationToken] = None,
+    ) -> tuple[np.ndarray, int]:
+        engine_voice = self.resolve_voice(voice)
+        options = {}
+        if engine_voice:
+            options["voice"] = engine_voice
+        lang_code = self.lang_code_for(engine_voice)
+        if lang_code:
+            options["lang_code"] = lang_code
+        if self.split_pattern:
+            options["split_pattern"] = self.split_pattern
+
+        segments = []
+        sample_rate = None
+        # Don't load (or evict another model for) a request nobody wants any more
+        cancellation.check(cancel_token)
+        with memory_manager.use_model(self.model_name, load_tts_model) as model:
+            cancellation.check(cancel_token)
+            with tracing.span("generate", model=self.model_name), \
+                    cost_model.measure(self.name, cost_model.count_tokens(text), cost_model.TOKENS):
+                results = model.generate(text=text, speed=speed, verbose=False, **options)
+                try:
+                    for result in results:
+                        segments.append(np.asarray(result.audio, dtype=np.float32).squeeze())
+                        sample_rate = result.sample_rate
+                        cancellation.check(cancel_token)
+                finally:
+                    results.close()
+        if not segments:
+            raise RuntimeError(f"{self.model_name} produced no audio")
+        return np.concatenate(segments), sample_rate
+
+
+class StubEngine(TTSEngine):
+    """Deterministic tones sized to the text; needs no model or accelerator."""
+
+    SAMPLE_RATE = 24000
+    SECONDS_PER_WORD = 0.3
+    PITCHES = {"alloy": 220.0, "echo": 247.0, "fable": 262.0, "onyx": 196.0, "nova": 294.0, "shimmer": 330.0}
+
+    def synthesize(
+        self,
+        text: str,
+        voice: Optional[str],
+        speed: float = 1.0,
+        cancel_token: Optional[cancellation.CancellationToken] = None,
+    ) -> tuple[np.ndarray, int]:
+        cancellation.check(cancel_token)
+        with tracing.span("generate", model="stub"), \
+                cost_model.measure(self.name, cost_model.count_tokens(text), cost_model.TOKENS):
+            seconds = max(len(text.split()), 1) * self.SECONDS_PER_WORD / speed
+            t = np.arange(int(seconds * self.SAMPLE_RATE), dtype=np.float32) / self.SAMPLE_RATE
+            audio = 0.2 * np.sin(2 * np.pi * self.PITCHES.get(voice, 220.0) * t)
+        return audio.astype(np.float32), self.SAMPLE_RATE
+
+
+ENGINE_TYPES = {
+    "mlx": MlxAudioEngine,
+    "stub": StubEngine,
+}
+
+
+def load_routes() -> Dict[str, Dict[str, Any]]:
+    routes = {name: dict(route) for name, route in DEFAULT_ROUTES.items()}
+    routes_file = os.getenv("TTS_ROUTES_FILE")
+    if routes_file:
+        with open(routes_file, encoding="utf-8") as f:
+            routes.update(json.load(f))
+    return routes
+
+
+ROUTES = load_routes()
+_engines: Dict[str, TTSEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def route_for(model: str) -> str:
+    return model if model in ROUTES else DEFAULT_ROUTE
+
+
+def engine_for(model: str) -> TTSEngine:
+    """Returns the engine serving the request model `model`."""
+    route = route_for(model)
+    with _engines_lock:
+        engine = _engines.get(route)
+        if engine is None:
+            config = dict(ROUTES[route])
+            engine_type = ENGINE_TYPES[config.pop("engine")]
+            engine = engine_type(route, **config)
+            _engines[route] = engine
+        return engine
@@ -1,187 +1,207 @@
-# Placeholder for TTS logic using mlx-audio
+# TTS logic: routed synthesis through the engine layer, and voice cloning with mlx-audio
 
 import io
-import time
-import gc  # 新增：用于手动回收内存
+
+import numpy as np
+
 from .models import TTSRequest # Use relative import
-from mlx_audio.tts.generate import generate_audio
+from . import audio_io
+from . import cancellation
+from . import coalescing
+from . import cost_model
+from . import ref_audio as ref_audio_prep
+from . import render_cache
+from . import stt_logic
+from . import time_stretch
+from . import tracing
+from . import tts_engines
+from .memory_manager import manager as memory_manager
+from .tts_engines import load_tts_model
+
+CLONE_MODEL = "mlx-community/csm-1b"  # CSM (Sesame) for voice cloning - supported by mlx_audio and cached locally
+
+# The clone model is run on pieces of about this many words (whole sentences),
+# so a cancelled request stops within one piece
+CLONE_CHECKPOINT_WORDS = 40
+
+
+def speech_render_key(request: TTSRequest) -> str:
+    """Render-cache key of the 1.0x audio for a speech request."""
+    engine = tts_engines.engine_for(request.model)
+    return coalescing.request_key("speech_render", engine=engine.name, input=request.input, voice=request.voice)
 
-def generate_speech_from_text_sync(request: TTSRequest) -> tuple[io.BytesIO, str]:
+
+def generate_speech_from_text_sync(
+    request: TTSRequest,
+    cancel_token: cancellation.CancellationToken = None
+) -> tuple[io.BytesIO, str]:
     """
-    每次请求时加载模型，合成后立即释放内存。
+    按 request.model 路由到对应的 TTS 引擎合成语音，内存压力由 memory_manager 统一管理。
     Args:
         request: TTS request details.
+        cancel_token: Optional token; generation stops with OperationCancelled once it fires.
     Returns:
         A tuple containing an in-memory audio buffer (BytesIO) and the content type string.
     """
-    print(f"Generating speech for text: '{request.input[:30]}...' using voice '{request.voice}'")
-
-    import tempfile
-    import os
+    engine = tts_engines.engine_for(request.model)
+    output_format = request.response_format or "mp3"
+    speed = request.speed or 1.0
 
-    temp_dir = tempfile.gettempdir()
-    temp_file_prefix = os.path.join(temp_dir, "tts_temp")
+    print(f"Generating speech for text: '{request.input[:30]}...' using {engine.name}, voice '{request.voice}'")
 
-    output_format = request.response_format if hasattr(request, 'response_format') else "mp3"
-
-    # ----------------------
-    # 每次请求时加载模型并生成音频
-    # ----------------------
-    # 注意：mlx_audio.tts.generate.generate_audio 内部会自动加载模型
-
-    generate_audio(
-        text=request.input,
-        model="mlx-community/Dia-1.6B-fp16",
-        file_prefix=temp_file_prefix,
-        audio_format=output_format,
-        voice="af_heart",
-        verbose=True
+    # Always render at 1.0x (or reuse a cached render); other speeds are time-stretched
+    render_key = speech_render_key(request)
+    audio, sample_rate = render_cache.cache.get_or_render(
+        render_key,
+        lambda: engine.synthesize(request.input, request.voice, 1.0, cancel_token=cancel_token),
+        cancel_token=cancel_token,
     )
+
     # ----------------------
-    # 生成完毕后，尝试释放内存
+    # 仅在内存压力较大时回收内存 / 驱逐空闲模型
     # ----------------------
-    gc.collect()  # 强制回收内存，防止模型常驻
-
-    temp_file_name = f"{temp_file_prefix}_000.{output_format}"
-    if not os.path.exists(temp_file_name):
-        temp_file_name = f"{temp_file_prefix}.{output_format}"
-        if not os.path.exists(temp_file_name):
-            raise FileNotFoundError(f"Generated audio file not found: {temp_file_name}")
-
-    with open(temp_file_name, "rb") as f:
-        audio_content = f.read()
-    audio_buffer = io.BytesIO(audio_content)
-
-    content_type_map = {
-        "mp3": "audio/mpeg",
-        "opus": "audio/opus",
-        "aac": "audio/aac",
-        "flac": "audio/flac",
-        "wav": "audio/wav",
-    }
-    content_type = content_type_map.get(output_format, "audio/mpeg")
+    memory_manager.relieve_pressure()
 
-    try:
-        os.remove(temp_file_name)
-    except Exception as e:
-        print(f"Warning: Could not delete temporary file {temp_file_name}: {e}")
+    audio = _apply_speed(audio, sample_rate, speed)
+
+    with tracing.span("encode", format=output_format):
+        audio_content = audio_io.encode_audio(audio, sample_rate, output_format)
+    content_type = audio_io.content_type_for(output_format)
 
     print(f"Audio generation complete. Returning {len(audio_content)} bytes as {content_type}")
-    return audio_buffer, content_type
+    return io.BytesIO(audio_content), content_type
+
+
+def _apply_speed(audio: np.ndarray, sample_rate: int, speed: float) -> np.ndarray:
+    """Time-stretches a 1.0x render to `speed` without changing its pitch."""
+    if speed == 1.0:
+        return audio
+    with tracing.span("time_stretch", speed=speed):
+        return time_stretch.time_stretch(audio, speed, sample_rate)
+
+
+def _load_reference(model, ref_audio: bytes, ref_text: str = None):
+    """
+    Preprocesses the reference audio for the model (see ref_audio.py) and
+    returns it as an mx.array with its transcript. The clip is transcribed
+    with whisper if no transcript was given, or if capping its length dropped
+    speech the given transcript covers.
+    """
+    import mlx.core as mx
+
+    with tracing.span("preprocess_reference"):
+        reference = ref_audio_prep.prepare_reference(ref_audio, model.sample_rate)
+    if ref_text and reference.truncated:
+        print(f"Reference audio was capped to {reference.seconds:.1f}s; re-transcribing instead of using ref_text")
+        ref_text = None
+    if not ref_text:
+        if reference.transcript is None:
+            print("Ref_text not provided. Transcribing ref_audio...")
+            with memory_manager.use_model(stt_logic.DEFAULT_STT_MODEL, stt_logic.load_stt_model) as stt_model, \
+                    tracing.span("transcribe_reference"):
+                # Whisper expects 16 kHz input
+                reference.transcript = stt_model.generate(mx.array(reference.at_rate(16000))).text
+        ref_text = reference.transcript
+        print(f"Ref_text: {ref_text}")
+    return mx.array(reference.audio), ref_text
+
+
+def _generate_cloned_audio(
+    model,
+    text: str,
+    ref_audio,
+    ref_text: str,
+    cancel_token: cancellation.CancellationToken = None,
+    chunk: int = None,
+    verbose: bool = True
+) -> tuple[np.ndarray, int]:
+    """
+    Runs the clone model on `text` at 1.0x and returns float32 PCM and its sample rate.
+    The text is generated a few sentences at a time (CLONE_CHECKPOINT_WORDS),
+    and the cancellation token is checked before starting and after every
+    segment, so abandoned requests stop generating promptly.
+    """
+    cancellation.check(cancel_token)
+    segments = []
+    pieces = chunk_text(text, max_words=CLONE_CHECKPOINT_WORDS) or [text]
+    with tracing.span("generate", model=CLONE_MODEL, chunk=chunk), \
+            cost_model.measure(CLONE_MODEL, cost_model.count_tokens(text), cost_model.TOKENS):
+        for piece in pieces:
+            results = model.generate(
+                text=piece,
+                ref_audio=ref_audio,
+                ref_text=ref_text,
+                temperature=0.7,
+                max_tokens=1200,
+                verbose=verbose
+            )
+            try:
+                for result in results:
+                    segments.append(np.asarray(result.audio, dtype=np.float32).squeeze())
+                    cancellation.check(cancel_token)
+            finally:
+                results.close()
+    if not segments:
+        raise RuntimeError(f"{CLONE_MODEL} produced no audio")
+    return np.concatenate(segments), model.sample_rate
 
 
 def generate_cloned_speech_sync(
     text: str,
-    ref_audio_path: str,
+    ref_audio: bytes,
     ref_text: str = None,
     output_format: str = "mp3",
-    speed: float = 1.0
+    speed: float = 1.0,
+    cancel_token: cancellation.CancellationToken = None
 ) -> tuple[io.BytesIO, str]:
     """
     Generate speech using voice cloning from a reference audio.
     
     Args:
         text: The text to synthesize.
-        ref_audio_path: Path to the reference audio file for voice cloning.
+        ref_audio: Contents of the uploaded reference audio file.
         ref_text: Optional transcript of the reference audio.
         output_format: Output audio format (mp3, wav, etc.)
         speed: Speech speed multiplier.
+        cancel_token: Optional token; generation stops with OperationCancelled once it fires.
     
     Returns:
         A tuple containing an in-memory audio buffer (BytesIO) and the content type string.
     """
-    print(f"Generating cloned speech for text: '{text[:50]}...' using reference audio: '{ref_audio_path}'")
-    
-    import tempfile
-    import os
-    import glob
-    
-    temp_dir = tempfile.gettempdir()
-    temp_file_prefix = os.path.join(temp_dir, "tts_clone_temp")
-    
-    # Clean up any previous temp files first
-    for old_file in glob.glob(f"{temp_file_prefix}*"):
-        try:
-            os.remove(old_file)
-        except:
-            pass
-    
-    print(f"Calling generate_audio with ref_audio={ref_audio_path}, ref_text={ref_text}")
-    
-    # Generate audio with voice cloning using CSM (Sesame's Conversational Speech Model)
+    print(f"Generating cloned speech for text: '{text[:50]}...' using {len(ref_audio)} bytes of reference audio")
+    
+    def render():
+        cancellation.check(cancel_token)
+        with memory_manager.use_model(CLONE_MODEL, load_tts_model) as model:
+            cancellation.check(cancel_token)
+            ref_samples, clip_text = _load_reference(model, ref_audio, ref_text)
+            return _generate_cloned_audio(model, text, ref_samples, clip_text, cancel_token=cancel_token)
+
+    # Generate audio with voice cloning using CSM (Sesame's Conversational Speech Model),
+    # at 1.0x so the render can be reused for other speeds
+    render_key = coalescing.request_key(
+        "clone_render", input=text, ref_audio=coalescing.content_hash(ref_audio), ref_text=ref_text
+    )
     try:
-        generate_audio(
-            text=text,
-            model="mlx-community/csm-1b",  # CSM (Sesame) for voice cloning - supported by mlx_audio and cached locally
-            file_prefix=temp_file_prefix,
-            audio_format=output_format,
-            ref_audio=ref_audio_path,
-            ref_text=ref_text,
-            speed=speed,
-            verbose=True
-        )
+        audio, sample_rate = render_cache.cache.get_or_render(render_key, render, cancel_token=cancel_token)
+    except cancellation.OperationCancelled as e:
+        print(f"Voice cloning cancelled: {e}")
+        raise
     except Exception as e:
-        print(f"Error in generate_audio: {e}")
+        print(f"Error in voice cloning generation: {e}")
         raise
     
-    # Force garbage collection after generation
-    gc.collect()
-    
-    # Find the generated file using glob (handles various naming patterns and formats)
-    # F5-TTS may output different formats than requested
-    all_formats = [output_format, "wav", "mp3", "flac"]
-    possible_patterns = []
-    for fmt in all_formats:
-        possible_patterns.extend([
-            f"{temp_file_prefix}_000.{fmt}",
-            f"{temp_file_prefix}.{fmt}",
-            f"{temp_file_prefix}_*.{fmt}",
-            f"{temp_file_prefix}*.{fmt}",
-        ])
+    # Release memory only if we are close to the budget
+    memory_manager.relieve_pressure()
     
-    temp_file_name = None
-    for pattern in possible_patterns:
-        matches = glob.glob(pattern)
-        if matches:
-            temp_file_name = matches[0]
-            print(f"Found output file: {temp_file_name}")
-            break
+    audio = _apply_speed(audio, sample_rate, speed)
     
-    if not temp_file_name:
-        # List ALL files in temp dir matching prefix
-        all_temp_files = glob.glob(f"{temp_file_prefix}*")
-        # Also list recent audio files in temp dir
-        import time
-        recent_audio = []
-        for f in glob.glob(os.path.join(temp_dir, "*.mp3")) + glob.glob(os.path.join(temp_dir, "*.wav")):
-            if os.path.getmtime(f) > time.time() - 60:  # Last 60 seconds
-                recent_audio.append(f)
-        print(f"Files matching prefix: {all_temp_files}")
-        print(f"Recent audio files in temp: {recent_audio}")
-        raise FileNotFoundError(f"Generated audio file not found. Searched patterns: {possible_patterns[:4]}")
-    
-    # Read the generated audio
-    with open(temp_file_name, "rb") as f:
-        audio_content = f.read()
-    audio_buffer = io.BytesIO(audio_content)
-    
-    content_type_map = {
-        "mp3": "audio/mpeg",
-        "opus": "audio/opus",
-        "aac": "audio/aac",
-        "flac": "audio/flac",
-        "wav": "audio/wav",
-    }
-    content_type = content_type_map.get(output_format, "audio/mpeg")
-    
-    # Clean up temp file
-    try:
-        os.remove(temp_file_name)
-    except Exception as e:
-        print(f"Warning: Could not delete temporary file {temp_file_name}: {e}")
+    with tracing.span("encode", format=output_format):
+        audio_content = audio_io.encode_audio(audio, sample_rate, output_format)
+    content_type = audio_io.content_type_for(output_format)
     
     print(f"Voice cloning complete. Returning {len(audio_content)} bytes as {content_type}")
-    return audio_buffer, content_type
+    return io.BytesIO(audio_content), content_type
 
 
 def chunk_text(text: str, max_words: int = 300) -> list[str]:
@@ -247,60 +267,95 @@ def chunk_text(text: str, max_words: int = 300) -> list[str]:
     return chunks
 
 
-def concatenate_audio_files(audio_files: list[str], output_path: str, output_format: str = "mp3"):
-    """
-    Concatenate multiple audio files into one.
-    Uses pydub for audio concatenation.
+def load_long_form_reference(
+    ref_audio: bytes,
+    ref_text: str = None,
+    cancel_token: cancellation.CancellationToken = None
+):
+    """Preprocesses (and if needed transcribes) the reference once for all chunks of a long-form job."""
+    cancellation.check(cancel_token)
+    with memory_manager.use_model(CLONE_MODEL, load_tts_model) as model:
+        return _load_reference(model, ref_audio, ref_text)
+
+
+def generate_long_form_chunk(
+    chunk: str,
+    index: int,
+    total: int,
+    ref_samples,
+    ref_text: str,
+    cancel_token: cancellation.CancellationToken = None
+) -> tuple[np.ndarray, int]:
+    """Generates one chunk of a long-form job at 1.0x; returns float32 PCM and its sample rate."""
+    # Stop before starting another chunk if the result is no longer wanted
+    if cancel_token is not None and cancel_token.cancelled:
+        print(f"Long-form voice cloning cancelled after {index}/{total} chunks: {cancel_token.reason}")
+        cancel_token.check()
+    
+    print(f"Processing chunk {index+1}/{total}: '{chunk[:50]}...'")
+    
+    # The model stays resident between chunks unless memory pressure evicts it
+    with memory_manager.use_model(CLONE_MODEL, load_tts_model) as model:
+        audio, sample_rate = _generate_cloned_audio(
+            model, chunk, ref_samples, ref_text,
+            cancel_token=cancel_token, chunk=index, verbose=False  # Less verbose for chunks
+        )
+    print(f"Chunk {index+1} complete: {len(audio) / sample_rate:.1f}s")
     
-    Args:
-        audio_files: List of paths to audio files to concatenate.
-        output_path: Path for the output concatenated file.
-        output_format: Output format (mp3, wav, etc.)
-    """
-    from pydub import AudioSegment
+    # Collect between chunks only under memory pressure
+    memory_manager.relieve_pressure()
+    return audio, sample_rate
+
+
+def finish_long_form(
+    chunk_audio: list[np.ndarray],
+    sample_rate: int,
+    output_format: str = "mp3",
+    speed: float = 1.0
+) -> tuple[io.BytesIO, str]:
+    """Concatenates the chunks of a long-form job, applies the speed and encodes the result."""
+    with tracing.span("concatenate", chunks=len(chunk_audio)):
+        combined = np.concatenate(chunk_audio)
+    print(f"Concatenated {len(chunk_audio)} chunks ({len(combined) / sample_rate:.1f}s)")
     
-    combined = AudioSegment.empty()
+    combined = _apply_speed(combined, sample_rate, speed)
     
-    for audio_file in audio_files:
-        # Detect format from extension
-        ext = audio_file.split('.')[-1].lower()
-        segment = AudioSegment.from_file(audio_file, format=ext)
-        combined += segment
+    with tracing.span("encode", format=output_format):
+        audio_content = audio_io.encode_audio(combined, sample_rate, output_format)
+    content_type = audio_io.content_type_for(output_format)
     
-    # Export with appropriate format
-    combined.export(output_path, format=output_format)
-    print(f"Concatenated {len(audio_files)} audio files into {output_path}")
+    print(f"Long-form voice cloning complete. {len(chunk_audio)} chunks -> {len(audio_content)} bytes")
+    return io.BytesIO(audio_content), content_type
 
 
 def generate_cloned_speech_long_sync(
     text: str,
-    ref_audio_path: str,
+    ref_audio: bytes,
     ref_text: str = None,
     output_format: str = "mp3",
     speed: float = 1.0,
     max_words_per_chunk: int = 300,
-    progress_callback = None
+    progress_callback = None,
+    cancel_token: cancellation.CancellationToken = None
 ) -> tuple[io.BytesIO, str]:
     """
     Generate long-form speech using voice cloning.
     Chunks the text, generates audio for each chunk, and concatenates.
+    The server runs the same steps with each chunk scheduled separately.
     
     Args:
         text: The full text to synthesize (can be 2000-20000+ words).
-        ref_audio_path: Path to the reference audio file for voice cloning.
+        ref_audio: Contents of the uploaded reference audio file.
         ref_text: Optional transcript of the reference audio.
         output_format: Output audio format (mp3, wav, etc.)
         speed: Speech speed multiplier.
         max_words_per_chunk: Maximum words per chunk (default 300).
         progress_callback: Optional callback(current_chunk, total_chunks) for progress.
+        cancel_token: Optional token, checked before each chunk and during generation.
     
     Returns:
         A tuple containing an in-memory audio buffer (BytesIO) and the content type string.
     """
-    import tempfile
-    import os
-    import glob
-    
     word_count = len(text.split())
     print(f"Starting long-form voice cloning: {word_count} words")
     
@@ -312,100 +367,21 @@ def generate_cloned_speech_long_sync(
     if len(chunks) == 1:
         return generate_cloned_speech_sync(
             text=chunks[0],
-            ref_audio_path=ref_audio_path,
+            ref_audio=ref_audio,
             ref_text=ref_text,
             output_format=output_format,
-            speed=speed
+            speed=speed,
+            cancel_token=cancel_token
         )
     
-    temp_dir = tempfile.gettempdir()
-    chunk_audio_files = []
+    ref_samples, ref_text = load_long_form_reference(ref_audio, ref_text, cancel_token)
     
-    try:
-        # Generate audio for each chunk
-        for i, chunk in enumerate(chunks):
-            print(f"Processing chunk {i+1}/{len(chunks)}: '{chunk[:50]}...'")
-            
-            if progress_callback:
-                progress_callback(i + 1, len(chunks))
-            
-            chunk_prefix = os.path.join(temp_dir, f"tts_chunk_{i:04d}")
-            
-            # Clean up any previous temp files for this chunk
-            for old_file in glob.glob(f"{chunk_prefix}*"):
-                try:
-                    os.remove(old_file)
-                except:
-                    pass
-            
-            # Generate audio for this chunk
-            generate_audio(
-                text=chunk,
-                model="mlx-community/csm-1b",
-                file_prefix=chunk_prefix,
-                audio_format=output_format,
-                ref_audio=ref_audio_path,
-                ref_text=ref_text,
-                speed=speed,
-                verbose=False  # Less verbose for chunks
-            )
-            
-            # Find the generated file
-            all_formats = [output_format, "wav", "mp3", "flac"]
-            chunk_file = None
-            for fmt in all_formats:
-                for pattern in [f"{chunk_prefix}_000.{fmt}", f"{chunk_prefix}.{fmt}"]:
-                    if os.path.exists(pattern):
-                        chunk_file = pattern
-                        break
-                    matches = glob.glob(pattern)
-                    if matches:
-                        chunk_file = matches[0]
-                        break
-                if chunk_file:
-                    break
-            
-            if not chunk_file:
-                raise FileNotFoundError(f"Failed to generate audio for chunk {i+1}")
-            
-            chunk_audio_files.append(chunk_file)
-            print(f"Chunk {i+1} complete: {chunk_file}")
-            
-            # Garbage collect between chunks
-            gc.collect()
-        
-        # Concatenate all chunks
-        output_path = os.path.join(temp_dir, f"tts_final_output.{output_format}")
-        concatenate_audio_files(chunk_audio_files, output_path, output_format)
-        
-        # Read the final audio
-        with open(output_path, "rb") as f:
-            audio_content = f.read()
-        audio_buffer = io.BytesIO(audio_content)
-        
-        content_type_map = {
-            "mp3": "audio/mpeg",
-            "opus": "audio/opus",
-            "aac": "audio/aac",
-            "flac": "audio/flac",
-            "wav": "audio/wav",
-        }
-        content_type = content_type_map.get(output_format, "audio/mpeg")
-        
-        print(f"Long-form voice cloning complete. {len(chunks)} chunks -> {len(audio_content)} bytes")
-        return audio_buffer, content_type
-        
-    finally:
-        # Clean up all chunk files
-        for chunk_file in chunk_audio_files:
-            try:
-                os.remove(chunk_file)
-            except:
-                pass
-        
-        # Clean up final output
-        try:
-            os.remove(output_path)
-        except:
-            pass
-
+    chunk_audio = []
+    sample_rate = None
+    for i, chunk in enumerate(chunks):
+        if progress_callback:
+            progress_callback(i + 1, len(chunks))
+        audio, sample_rate = generate_long_form_chunk(chunk, i, len(chunks), ref_samples, ref_text, cancel_token)
+        chunk_audio.append(audio)
+    
+    return finish_long_form(chunk_audio, sample_rate, output_format, speed)
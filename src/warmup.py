@@ -0,0 +1,78 @@
+# Background import of the inference backends
+#
+# The endpoints import mlx / mlx-audio lazily so the server binds and answers
+# liveness checks right away. Importing them still takes seconds, so at
+# startup a daemon thread imports the WARM_IMPORTS modules in the background;
+# /readyz reports ready once they are loaded. Set WARM_IMPORTS to an empty
+# string to skip the warm-up (e.g. on hosts that only serve the stub engine).
+
+import importlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_WARM_IMPORTS = "mlx.core,mlx_audio.tts.utils,mlx_audio.stt.models.whisper"
+WARM_IMPORTS = [
+    name.strip() for name in os.getenv("WARM_IMPORTS", DEFAULT_WARM_IMPORTS).split(",") if name.strip()
+]
+
+
+class _Warmup:
+    """Imports a list of modules once, in a background thread."""
+
+    def __init__(self, modules: List[str]):
+        self.modules = modules
+        self.loaded: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set() and not self.errors
+
+    def start(self):
+        with self._lock:
+            if self.started_at is not None:
+                return
+            self.started_at = time.time()
+        if not self.modules:
+            self.finished_at = self.started_at
+            self._done.set()
+            return
+        threading.Thread(target=self._run, name="warm-imports", daemon=True).start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _run(self):
+        for name in self.modules:
+            start = time.perf_counter()
+            try:
+                importlib.import_module(name)
+                self.loaded[name] = round(time.perf_counter() - start, 3)
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+                print(f"Warning: Could not import {name} during warm-up: {e}")
+        self.finished_at = time.time()
+        self._done.set()
+        print(f"Backend warm-up finished in {self.finished_at - self.started_at:.2f}s ({len(self.loaded)}/{len(self.modules)} modules)")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "finished": self._done.is_set(),
+            "modules": self.modules,
+            "import_seconds": dict(self.loaded),
+            "errors": dict(self.errors),
+        }
+
+
+warmup = _Warmup(WARM_IMPORTS)
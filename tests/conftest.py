@@ -0,0 +1,8 @@
+# Test configuration: set before any `src` module reads its environment
+
+import os
+
+# No mlx on CI hosts; only the stub engine is exercised
+os.environ["WARM_IMPORTS"] = ""
+os.environ["TRACE_LOG_FILE"] = ""
+os.environ["API_KEY"] = "test-key"
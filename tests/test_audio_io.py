@@ -0,0 +1,61 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from src.audio_io import probe_duration
+
+
+def _encode(seconds, sample_rate, format, subtype=None, channels=1):
+    audio = np.zeros((int(seconds * sample_rate), channels), dtype=np.float32)
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sample_rate, format=format, subtype=subtype)
+    return buffer.getvalue()
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def _mp4(timescale, duration, version=0):
+    if version == 1:
+        mvhd = bytes([1, 0, 0, 0]) + struct.pack(">QQIQ", 0, 0, timescale, duration)
+    else:
+        mvhd = bytes(4) + struct.pack(">IIII", 0, 0, timescale, duration)
+    ftyp = _box(b"ftyp", b"M4A " + bytes(4) + b"isomM4A ")
+    moov = _box(b"moov", _box(b"mvhd", mvhd + bytes(80)))
+    return ftyp + _box(b"free", bytes(16)) + moov + _box(b"mdat", bytes(64))
+
+
+@pytest.mark.parametrize("sample_rate,channels", [(16000, 1), (44100, 2)])
+def test_wav(sample_rate, channels):
+    data = _encode(3.5, sample_rate, "WAV", "PCM_16", channels)
+    assert probe_duration(data) == pytest.approx(3.5, abs=1e-3)
+
+
+def test_wav_with_unset_data_size():
+    data = bytearray(_encode(2.0, 16000, "WAV", "PCM_16"))
+    data_chunk = data.index(b"data")
+    data[data_chunk + 4:data_chunk + 8] = bytes(4)
+    assert probe_duration(bytes(data)) == pytest.approx(2.0, abs=1e-3)
+
+
+def test_flac():
+    assert probe_duration(_encode(4.25, 24000, "FLAC")) == pytest.approx(4.25, abs=1e-3)
+
+
+def test_mp3():
+    # libsndfile writes a Xing/Info header with the frame count
+    assert probe_duration(_encode(5.0, 24000, "MP3")) == pytest.approx(5.0, abs=0.1)
+
+
+@pytest.mark.parametrize("version", [0, 1])
+def test_mp4(version):
+    assert probe_duration(_mp4(44100, 44100 * 12, version)) == pytest.approx(12.0)
+
+
+def test_unknown_data():
+    assert probe_duration(b"not audio at all") is None
+    assert probe_duration(b"") is None
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src import cancellation, tts_engines, tts_logic
+
+
+class FakeModel:
+    """Yields one segment per sentence, like Kokoro with a sentence split_pattern."""
+
+    sample_rate = 24000
+
+    def __init__(self, on_segment=None):
+        self.calls = []
+        self.segments = 0
+        self.on_segment = on_segment
+
+    def generate(self, text, **kwargs):
+        self.calls.append((text, kwargs))
+        for _ in text.split(". "):
+            self.segments += 1
+            if self.on_segment:
+                self.on_segment()
+            yield SimpleNamespace(audio=np.zeros(240, dtype=np.float32), sample_rate=self.sample_rate)
+
+
+def test_token_fired_before_model_load(monkeypatch):
+    def loader(name):
+        raise AssertionError("the model must not be loaded for a cancelled request")
+
+    monkeypatch.setattr(tts_engines, "load_tts_model", loader)
+    token = cancellation.CancellationToken()
+    token.cancel("client gone")
+    with pytest.raises(cancellation.OperationCancelled):
+        tts_engines.engine_for("tts-1").synthesize("Hello there.", "alloy", cancel_token=token)
+
+
+def test_kokoro_stops_between_sentences(monkeypatch):
+    token = cancellation.CancellationToken()
+    model = FakeModel(on_segment=lambda: token.cancel("deadline exceeded"))
+    monkeypatch.setattr(tts_engines, "load_tts_model", lambda name: model)
+    engine = tts_engines.MlxAudioEngine(
+        "test-kokoro", model="test/kokoro", split_pattern=tts_engines.DEFAULT_ROUTES["tts-1"]["split_pattern"]
+    )
+
+    with pytest.raises(cancellation.OperationCancelled):
+        engine.synthesize("One. Two. Three.", "af_alloy", cancel_token=token)
+    assert model.segments == 1
+    assert model.calls[0][1]["split_pattern"] == engine.split_pattern
+
+
+def test_clone_generation_checks_between_sentences():
+    text = " ".join(f"This is sentence number {i} of the test." for i in range(20))
+    token = cancellation.CancellationToken()
+    model = FakeModel(on_segment=lambda: token.cancel("client gone") if len(model.calls) == 2 else None)
+
+    with pytest.raises(cancellation.OperationCancelled):
+        tts_logic._generate_cloned_audio(model, text, None, "reference", cancel_token=token)
+    # Stopped after the second piece instead of running the whole text
+    assert len(model.calls) == 2
+    assert all(len(call[0].split()) <= tts_logic.CLONE_CHECKPOINT_WORDS for call in model.calls)
+
+
+def test_clone_generation_covers_the_whole_text():
+    text = " ".join(f"This is sentence number {i} of the test." for i in range(20))
+    model = FakeModel()
+    audio, sample_rate = tts_logic._generate_cloned_audio(model, text, None, "reference")
+    assert " ".join(call[0] for call in model.calls) == text
+    assert sample_rate == FakeModel.sample_rate and len(audio) > 0
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from src.coalescing import SingleFlight, request_key
+
+
+def test_request_key_ignores_field_order():
+    assert request_key("speech", input="hi", voice="alloy") == request_key("speech", voice="alloy", input="hi")
+    assert request_key("speech", input="hi") != request_key("clone", input="hi")
+
+
+def test_identical_requests_share_one_computation():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def compute(token):
+            calls.append(token)
+            await asyncio.sleep(0.05)
+            return "audio"
+
+        results = await asyncio.gather(*(flight.do("key", compute) for _ in range(3)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ["audio"] * 3
+    assert len(calls) == 1
+    assert stats == {"in_flight": 0, "started": 1, "coalesced": 2, "abandoned": 0}
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail(token):
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_one_waiter_giving_up_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight()
+        tokens = []
+
+        async def compute(token):
+            tokens.append(token)
+            await asyncio.sleep(0.05)
+            return "audio"
+
+        leaver = asyncio.create_task(flight.do("key", compute))
+        stayer = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        leaver.cancel()
+        result = await stayer
+        return result, tokens[0], flight.stats()
+
+    result, token, stats = asyncio.run(scenario())
+    assert result == "audio"
+    assert not token.cancelled
+    assert stats["abandoned"] == 0
+
+
+def test_last_waiter_giving_up_cancels_token_and_task():
+    async def scenario():
+        flight = SingleFlight()
+        seen = {}
+
+        async def compute(token):
+            seen["token"] = token
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                seen["task_cancelled"] = True
+                raise
+
+        waiter = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+        # A new request for the same key starts a fresh computation
+        async def again(token):
+            return token
+
+        fresh_token = await flight.do("key", again)
+        return seen, fresh_token, flight.stats()
+
+    seen, fresh_token, stats = asyncio.run(scenario())
+    assert seen["token"].cancelled
+    assert seen["task_cancelled"]
+    assert fresh_token is not seen["token"] and not fresh_token.cancelled
+    assert stats["abandoned"] == 1 and stats["started"] == 2
+
+
+def test_joining_waiter_extends_the_deadline():
+    async def scenario():
+        flight = SingleFlight()
+        tokens = []
+
+        async def compute(token):
+            tokens.append(token)
+            await asyncio.sleep(0.01)
+
+        first = asyncio.create_task(flight.do("key", compute, timeout=1))
+        await asyncio.sleep(0.001)
+        initial = tokens[0].deadline
+        second = asyncio.create_task(flight.do("key", compute, timeout=100))
+        await asyncio.sleep(0.001)
+        extended = tokens[0].deadline
+        await asyncio.gather(first, second)
+        return initial, extended
+
+    initial, extended = asyncio.run(scenario())
+    assert extended > initial + 90
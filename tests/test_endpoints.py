@@ -0,0 +1,78 @@
+import io
+
+import pytest
+import soundfile as sf
+from fastapi.testclient import TestClient
+
+from src import render_cache
+from src.main import app
+
+AUTH = {"Authorization": "Bearer test-key"}
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def _speech(client, speed=1.0, text="The quick brown fox jumps over the lazy dog"):
+    return client.post(
+        "/v1/audio/speech",
+        json={"model": "stub", "input": text, "voice": "alloy", "response_format": "flac", "speed": speed},
+    )
+
+
+def test_speech_with_stub_engine(client):
+    response = _speech(client)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/flac"
+    audio, sample_rate = sf.read(io.BytesIO(response.content))
+    # Nine words at 0.3 s each
+    assert len(audio) / sample_rate == pytest.approx(2.7, abs=0.01)
+
+    assert response.headers["X-Request-ID"]
+    assert "generate;dur=" in response.headers["Server-Timing"]
+    assert response.headers["X-Queue-Position"] == "0"
+    assert float(response.headers["X-Estimated-Duration"]) >= 0
+
+
+def test_speeds_share_one_render(client):
+    text = "Speed variants of this sentence are stretched from one render"
+    before = render_cache.cache.stats()["hits"]
+    normal = _speech(client, speed=1.0, text=text)
+    fast = _speech(client, speed=2.0, text=text)
+    assert normal.status_code == fast.status_code == 200
+    assert render_cache.cache.stats()["hits"] == before + 1
+
+    normal_audio, _ = sf.read(io.BytesIO(normal.content))
+    fast_audio, _ = sf.read(io.BytesIO(fast.content))
+    assert len(fast_audio) == pytest.approx(len(normal_audio) / 2, abs=2)
+
+
+def test_speech_rejects_out_of_range_speed(client):
+    assert _speech(client, speed=5.0).status_code == 422
+
+
+def test_request_id_is_reused(client):
+    response = client.post(
+        "/v1/audio/speech",
+        json={"model": "stub", "input": "Hello", "voice": "nova", "response_format": "flac"},
+        headers={"X-Request-ID": "test-request"},
+    )
+    assert response.headers["X-Request-ID"] == "test-request"
+
+
+def test_queue_status(client):
+    assert client.get("/v1/queue").status_code == 401
+    response = client.get("/v1/queue", headers=AUTH)
+    assert response.status_code == 200
+    status = response.json()
+    assert status["running"] == [] and status["queued"] == []
+    assert set(status["coalescing"]) == {"in_flight", "started", "coalesced", "abandoned"}
+
+
+def test_health_probes(client):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    # Nothing to warm up with WARM_IMPORTS empty
+    assert client.get("/readyz").status_code == 200
@@ -0,0 +1,47 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src import main, scheduler, tts_logic
+
+TEXT = " ".join(f"Sentence number {i} is here." for i in range(40))
+
+
+def test_long_form_chunks_do_not_hold_threads_while_queued(monkeypatch):
+    order = []
+
+    def generate_chunk(chunk, index, total, ref_samples, ref_text, cancel_token=None):
+        order.append(f"{ref_text}{index}")
+        time.sleep(0.02)
+        return np.zeros(240, dtype=np.float32), 24000
+
+    def short_job(cancel_token=None):
+        order.append("short")
+        return io.BytesIO(b"audio"), "audio/wav"
+
+    monkeypatch.setattr(scheduler, "scheduler", scheduler.InferenceScheduler(slots=1))
+    monkeypatch.setattr(tts_logic, "load_long_form_reference", lambda audio, text, token=None: (None, text))
+    monkeypatch.setattr(tts_logic, "generate_long_form_chunk", generate_chunk)
+    monkeypatch.setattr(tts_logic, "finish_long_form", lambda audio, rate, fmt, speed: (io.BytesIO(b"long"), "audio/wav"))
+
+    async def scenario():
+        # Fewer threads than waiting jobs must not stall anything
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        long_jobs = [
+            asyncio.create_task(main._synthesize_long(TEXT, b"", name, "wav", 1.0, 50, cancel_token=None))
+            for name in ("a", "b")
+        ]
+        await asyncio.sleep(0.01)
+        short = main._synthesize(short_job, cost=("stub", 1), cancel_token=None)
+        return await asyncio.wait_for(asyncio.gather(short, *long_jobs), timeout=5)
+
+    results = asyncio.run(scenario())
+    assert results == [(b"audio", "audio/wav"), (b"long", "audio/wav"), (b"long", "audio/wav")]
+    chunks = len(tts_logic.chunk_text(TEXT, max_words=50))
+    assert chunks > 2
+    # The short job did not wait for both long jobs to finish
+    assert order.index("short") < len(order) - 1
+    assert len(order) == 2 * chunks + 1
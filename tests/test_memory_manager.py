@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from src import memory_manager
+from src.memory_manager import MB, MemoryBudgetExceeded, MemoryManager
+
+# Models without a size estimate are assumed to need this much
+MODEL_MB = memory_manager.DEFAULT_MODEL_ESTIMATE_MB
+
+
+@pytest.fixture
+def usage(monkeypatch):
+    """Fake process memory, in MB; MLX reports nothing."""
+    current = {"mb": 100}
+    monkeypatch.setattr(memory_manager, "process_rss_bytes", lambda: current["mb"] * MB)
+    monkeypatch.setattr(memory_manager, "accelerator_memory_bytes", lambda: {"active": 0, "cache": 0, "peak": 0})
+    return current
+
+
+def _manager(budget_mb, **kwargs):
+    return MemoryManager(budget_bytes=budget_mb * MB, **kwargs)
+
+
+def _load(manager, name):
+    with manager.use_model(name, lambda n: object()):
+        pass
+
+
+def _resident(manager):
+    return [model["name"] for model in manager.stats()["models"]]
+
+
+def test_models_stay_resident(usage):
+    manager = _manager(10 * MODEL_MB)
+    loads = []
+    for _ in range(3):
+        with manager.use_model("a", lambda name: loads.append(name) or object()):
+            pass
+    assert loads == ["a"]
+    assert _resident(manager) == ["a"]
+
+
+def test_load_over_budget_is_refused(usage):
+    manager = _manager(MODEL_MB)
+    with pytest.raises(MemoryBudgetExceeded, match="would exceed"):
+        _load(manager, "a")
+    assert manager.stats()["refused_loads"] == 1
+    assert _resident(manager) == []
+
+
+def test_load_times_out_waiting_for_memory(usage):
+    manager = _manager(MODEL_MB + 500, load_timeout=0.2)
+    with manager.use_model("a", lambda name: object()):
+        start = time.monotonic()
+        # "a" is in use, so it cannot be evicted to make room
+        with pytest.raises(MemoryBudgetExceeded, match="Timed out"):
+            _load(manager, "b")
+        assert time.monotonic() - start >= 0.2
+    assert _resident(manager) == ["a"]
+
+
+def test_load_waits_for_a_model_to_be_released(usage):
+    manager = _manager(MODEL_MB + 500, load_timeout=5)
+    acquired = threading.Event()
+
+    def hold():
+        with manager.use_model("a", lambda name: object()):
+            acquired.set()
+            time.sleep(0.1)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    acquired.wait()
+    _load(manager, "b")
+    holder.join()
+    assert _resident(manager) == ["b"]
+    assert manager.stats()["evictions"] == 1
+
+
+def test_eviction_skips_pinned_and_in_use_models(usage):
+    manager = _manager(3 * MODEL_MB + 500, load_timeout=0.1)
+    manager.pin("pinned")
+    _load(manager, "pinned")
+    _load(manager, "idle")
+    with manager.use_model("busy", lambda name: object()):
+        _load(manager, "new")
+        assert sorted(_resident(manager)) == ["busy", "new", "pinned"]
+        with manager.use_model("new", lambda name: object()):
+            # Every resident model is pinned or in use
+            with pytest.raises(MemoryBudgetExceeded):
+                _load(manager, "another")
+
+
+def test_least_recently_used_model_goes_first(usage):
+    manager = _manager(3 * MODEL_MB + 500)
+    for name in ("a", "b", "c"):
+        _load(manager, name)
+    _load(manager, "a")
+    _load(manager, "d")
+    assert sorted(_resident(manager)) == ["a", "c", "d"]
+
+
+@pytest.mark.parametrize("limit", [1, 2])
+def test_max_concurrency_gate(usage, limit):
+    manager = _manager(10 * MODEL_MB)
+    if limit > 1:
+        manager.set_max_concurrency("a", limit)
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+
+    def use():
+        with manager.use_model("a", lambda name: object()):
+            with lock:
+                active["now"] += 1
+                active["peak"] = max(active["peak"], active["now"])
+            time.sleep(0.05)
+            with lock:
+                active["now"] -= 1
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert active["peak"] == limit
+
+
+def test_relieve_pressure_only_above_threshold(usage):
+    manager = _manager(10 * MODEL_MB, pressure_ratio=0.5)
+    manager.pin("pinned")
+    for name in ("pinned", "a", "b"):
+        _load(manager, name)
+
+    manager.relieve_pressure()
+    assert manager.stats()["collections"] == 0
+    assert len(_resident(manager)) == 3
+
+    usage["mb"] = 8 * MODEL_MB
+    manager.relieve_pressure()
+    stats = manager.stats()
+    assert stats["collections"] >= 1
+    # Idle models are evicted while usage stays high; pinned ones are kept
+    assert _resident(manager) == ["pinned"]
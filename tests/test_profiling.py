@@ -0,0 +1,39 @@
+import pytest
+
+from src import profiling
+
+
+@pytest.fixture
+def allocations():
+    tracker = profiling._AllocationTracker()
+    yield tracker
+    tracker.stop()
+
+
+def test_request_is_tracked(allocations, monkeypatch):
+    monkeypatch.setattr(profiling, "allocations", allocations)
+    allocations.start(frames=1)
+    with profiling.inference_thread("req-1", "synthesize"):
+        buffers = [bytearray(1024) for _ in range(100)]
+    assert [entry["request_id"] for entry in allocations.per_request] == ["req-1"]
+    assert allocations.diff_from_baseline(5)
+    del buffers
+
+
+def test_stopping_tracemalloc_during_a_request(allocations, monkeypatch):
+    monkeypatch.setattr(profiling, "allocations", allocations)
+    allocations.start(frames=1)
+    with profiling.inference_thread("req-1", "synthesize"):
+        # POST /debug/tracemalloc/stop while the call is in flight
+        allocations.stop()
+    assert list(allocations.per_request) == []
+    assert allocations.diff_from_baseline() == []
+
+
+def test_stopping_tracemalloc_keeps_the_request_error(allocations, monkeypatch):
+    monkeypatch.setattr(profiling, "allocations", allocations)
+    allocations.start(frames=1)
+    with pytest.raises(ValueError, match="model failed"):
+        with profiling.inference_thread("req-1", "synthesize"):
+            allocations.stop()
+            raise ValueError("model failed")
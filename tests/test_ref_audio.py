@@ -0,0 +1,88 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from src import ref_audio
+from src.ref_audio import InvalidReferenceAudio, preprocess, prepare_reference
+
+RATE = 48000
+TARGET_RATE = 24000
+
+
+def _speech(seconds, rate=RATE, pause_every=None):
+    """A modulated tone standing in for speech, optionally silent for the last 0.2 s of every `pause_every` s."""
+    t = np.arange(int(seconds * rate)) / rate
+    audio = 0.3 * np.sin(2 * np.pi * 200 * t) * (1 + 0.3 * np.sin(2 * np.pi * 3 * t))
+    if pause_every:
+        audio[(t % pause_every) > pause_every - 0.2] = 0
+    return audio.astype(np.float32)
+
+
+def _rms_dbfs(audio):
+    return 20 * np.log10(np.sqrt(np.mean(np.square(audio))))
+
+
+def test_downmix_and_resample():
+    stereo = np.stack([_speech(3), _speech(3) * 0.5], axis=1)
+    reference = preprocess(stereo, RATE, TARGET_RATE)
+    assert reference.audio.ndim == 1
+    assert reference.sample_rate == TARGET_RATE
+    assert reference.seconds == pytest.approx(3.0, abs=0.05)
+    assert reference.source_seconds == pytest.approx(3.0)
+    assert not reference.truncated
+
+
+def test_silence_is_trimmed_to_the_speech():
+    silence = np.zeros(2 * RATE, dtype=np.float32)
+    audio = np.concatenate([silence, _speech(4), silence])
+    reference = preprocess(audio, RATE, TARGET_RATE)
+    # Four seconds of speech plus PAD_SECONDS on each side
+    assert reference.seconds == pytest.approx(4 + 2 * ref_audio.PAD_SECONDS, abs=0.05)
+
+
+def test_cap_cuts_at_the_last_pause_before_the_limit():
+    stereo = np.stack([_speech(65, pause_every=1.0)] * 2, axis=1)
+    reference = preprocess(stereo, RATE, TARGET_RATE, max_seconds=10)
+    assert reference.seconds == pytest.approx(10.0, abs=0.05)
+    assert reference.truncated
+
+
+def test_cap_without_pauses_stays_within_the_limit():
+    reference = preprocess(_speech(30), RATE, TARGET_RATE, max_seconds=10)
+    assert 10 - ref_audio.CUT_SEARCH_SECONDS <= reference.seconds <= 10
+    assert reference.truncated
+
+
+def test_loudness_is_normalized():
+    quiet = _speech(3) * 0.01
+    reference = preprocess(quiet, RATE, TARGET_RATE)
+    assert _rms_dbfs(reference.audio) == pytest.approx(ref_audio.REF_AUDIO_TARGET_DBFS, abs=1.0)
+
+
+def test_gain_is_limited_by_the_peak():
+    audio = _speech(3) * 0.05
+    audio[RATE] = 1.0
+    reference = preprocess(audio, RATE, TARGET_RATE)
+    assert np.max(np.abs(reference.audio)) <= ref_audio.PEAK_LIMIT + 1e-6
+
+
+@pytest.mark.parametrize("audio", [np.zeros(RATE, dtype=np.float32), np.zeros(0, dtype=np.float32)])
+def test_silent_or_empty_audio_is_rejected(audio):
+    with pytest.raises(InvalidReferenceAudio):
+        preprocess(audio, RATE, TARGET_RATE)
+
+
+def test_prepare_reference_decodes_and_caches():
+    buffer = io.BytesIO()
+    sf.write(buffer, _speech(2, rate=16000), 16000, format="WAV", subtype="PCM_16")
+    data = buffer.getvalue()
+    reference = prepare_reference(data, TARGET_RATE)
+    assert reference.sample_rate == TARGET_RATE
+    assert prepare_reference(data, TARGET_RATE) is reference
+
+
+def test_undecodable_upload_is_rejected():
+    with pytest.raises(InvalidReferenceAudio, match="Could not decode"):
+        prepare_reference(b"definitely not audio", TARGET_RATE)
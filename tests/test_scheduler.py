@@ -0,0 +1,168 @@
+import asyncio
+import time
+
+import pytest
+
+from src.cost_model import TOKENS, estimator
+from src.scheduler import InferenceScheduler, SchedulerOverloaded
+
+# Not observed by any other test, so its estimates stay at the prior
+MODEL = "test-scheduler-model"
+
+
+async def _hold(scheduler, label, units, release: asyncio.Event, order: list):
+    async with scheduler.slot(label, MODEL, units, TOKENS):
+        order.append(label)
+        await release.wait()
+
+
+async def _run(scheduler, label, units, order: list):
+    async with scheduler.slot(label, MODEL, units, TOKENS):
+        order.append(label)
+
+
+async def _run_with_deadline(scheduler, label, order, deadline):
+    async with scheduler.slot(label, MODEL, 1, TOKENS, deadline=deadline):
+        order.append(label)
+
+
+def test_shortest_expected_job_runs_first():
+    async def scenario():
+        scheduler = InferenceScheduler(slots=1, aging=0.0)
+        order = []
+        release = asyncio.Event()
+        hog = asyncio.create_task(_hold(scheduler, "hog", 1, release, order))
+        await asyncio.sleep(0)
+        long_job = asyncio.create_task(_run(scheduler, "long", 100, order))
+        await asyncio.sleep(0)
+        short_job = asyncio.create_task(_run(scheduler, "short", 1, order))
+        await asyncio.sleep(0)
+        assert [job["function"] for job in scheduler.status()["queued"]] == ["short", "long"]
+        release.set()
+        await asyncio.gather(hog, long_job, short_job)
+        return order
+
+    assert asyncio.run(scenario()) == ["hog", "short", "long"]
+
+
+def test_aging_lets_a_long_waiting_job_go_first():
+    async def scenario():
+        # Every second of waiting is worth 1000 seconds of expected run time
+        scheduler = InferenceScheduler(slots=1, aging=1000.0)
+        order = []
+        release = asyncio.Event()
+        hog = asyncio.create_task(_hold(scheduler, "hog", 1, release, order))
+        await asyncio.sleep(0)
+        long_job = asyncio.create_task(_run(scheduler, "long", 10, order))
+        await asyncio.sleep(0.05)
+        short_job = asyncio.create_task(_run(scheduler, "short", 1, order))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(hog, long_job, short_job)
+        return order
+
+    assert asyncio.run(scenario()) == ["hog", "long", "short"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = InferenceScheduler(slots=1)
+        order = []
+        release = asyncio.Event()
+        hog = asyncio.create_task(_hold(scheduler, "hog", 1, release, order))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_run(scheduler, "waiter", 1, order))
+        await asyncio.sleep(0)
+        assert len(scheduler.status()["queued"]) == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        status = scheduler.status()
+        assert status["queued"] == []
+        assert status["abandoned"] == 1
+
+        release.set()
+        await hog
+        # The slot is free again, so a new job starts immediately
+        await _run(scheduler, "after", 1, order)
+        return order, scheduler.status()
+
+    order, status = asyncio.run(scenario())
+    assert order == ["hog", "after"]
+    assert status["running"] == [] and status["finished"] == 2
+
+
+def test_job_predicted_to_start_after_its_deadline_is_rejected():
+    model = "test-scheduler-measured-model"
+    estimator.observe(model, 1, TOKENS, 0.2)
+
+    async def scenario():
+        scheduler = InferenceScheduler(slots=1)
+        release = asyncio.Event()
+
+        async def hog():
+            # Expected to run for 100 * 0.2 = 20 seconds
+            async with scheduler.slot("hog", model, 100, TOKENS):
+                await release.wait()
+
+        running = asyncio.create_task(hog())
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            async with scheduler.slot("late", model, 1, TOKENS, deadline=time.monotonic() + 5):
+                pass
+        status = scheduler.status()
+        release.set()
+        await running
+        return status
+
+    status = asyncio.run(scenario())
+    assert status["queued"] == []
+    assert status["rejected"] == 1
+
+
+def test_prior_estimates_never_reject():
+    async def scenario():
+        scheduler = InferenceScheduler(slots=1)
+        order = []
+        release = asyncio.Event()
+        # MODEL has no observations, so its 20 s estimate is only the prior
+        hog = asyncio.create_task(_hold(scheduler, "hog", 100, release, order))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(
+            _run_with_deadline(scheduler, "waiter", order, deadline=time.monotonic() + 5)
+        )
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(hog, waiter)
+        return order, scheduler.status()
+
+    order, status = asyncio.run(scenario())
+    assert order == ["hog", "waiter"]
+    assert status["rejected"] == 0
+
+
+def test_short_jobs_run_between_chunks_of_a_long_job():
+    async def scenario():
+        scheduler = InferenceScheduler(slots=1)
+        order = []
+        first_chunk = asyncio.Event()
+
+        async def long_job():
+            # Each chunk takes its own slot, as long-form cloning does
+            for chunk in range(2):
+                async with scheduler.slot("chunk", MODEL, 10, TOKENS):
+                    order.append(f"chunk{chunk}")
+                    if chunk == 0:
+                        first_chunk.set()
+                        await asyncio.sleep(0.05)
+
+        worker = asyncio.create_task(long_job())
+        await first_chunk.wait()
+        await _run(scheduler, "short", 1, order)
+        await worker
+        return order, scheduler.status()
+
+    order, status = asyncio.run(scenario())
+    assert order == ["chunk0", "short", "chunk1"]
+    assert status["running"] == [] and status["queued"] == []
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from src.time_stretch import time_stretch
+
+SAMPLE_RATE = 24000
+
+
+def _tone(frequency=220.0, seconds=2.0):
+    t = np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def _dominant_frequency(audio):
+    spectrum = np.abs(np.fft.rfft(audio * np.hanning(len(audio))))
+    return np.fft.rfftfreq(len(audio), 1 / SAMPLE_RATE)[np.argmax(spectrum)]
+
+
+@pytest.mark.parametrize("speed", [0.25, 0.5, 0.8, 1.25, 2.0, 4.0])
+def test_output_length(speed):
+    audio = _tone()
+    stretched = time_stretch(audio, speed, SAMPLE_RATE)
+    assert stretched.dtype == np.float32
+    assert len(stretched) == round(len(audio) / speed)
+
+
+@pytest.mark.parametrize("speed", [0.5, 2.0])
+def test_pitch_is_preserved(speed):
+    stretched = time_stretch(_tone(220.0), speed, SAMPLE_RATE)
+    assert _dominant_frequency(stretched) == pytest.approx(220.0, abs=2.0)
+
+
+def test_normal_speed_and_empty_input_are_unchanged():
+    audio = _tone()
+    assert np.array_equal(time_stretch(audio, 1.0, SAMPLE_RATE), audio)
+    assert len(time_stretch(np.zeros(0, dtype=np.float32), 2.0, SAMPLE_RATE)) == 0
+
+
+@pytest.mark.parametrize("speed", [0.2, 4.5])
+def test_rejects_out_of_range_speed(speed):
+    with pytest.raises(ValueError):
+        time_stretch(_tone(), speed, SAMPLE_RATE)
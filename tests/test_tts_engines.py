@@ -0,0 +1,17 @@
+from src import tts_engines
+
+
+def test_kokoro_language_follows_the_voice():
+    engine = tts_engines.engine_for("tts-1")
+    assert engine.lang_code_for(engine.resolve_voice("alloy")) == "a"
+    assert engine.lang_code_for(engine.resolve_voice("fable")) == "b"
+
+
+def test_route_lang_code_overrides_the_voice():
+    engine = tts_engines.MlxAudioEngine("custom", model="some/model", lang_code="j")
+    assert engine.lang_code_for("bm_fable") == "j"
+    assert tts_engines.engine_for("tts-1-hd").lang_code_for(None) is None
+
+
+def test_unknown_models_use_the_default_route():
+    assert tts_engines.route_for("no-such-model") == tts_engines.DEFAULT_ROUTE